@@ -1,16 +1,20 @@
 @echo off
 rem = """ Do any custom setup like setting environment variables etc if required here ...
-c:\python27\python -x "%~f0" %1 %2 %3 %4 %5 %6 %7 %8 %9
+python -x "%~f0" %1 %2 %3 %4 %5 %6 %7 %8 %9
 goto endofPython """
 
 import os
 import sys
-import subprocess as sp
 
 
 #bc = os.path.join(os.getcwd(), 'candb.py')
 bc = '''G:\\SampleCode\\PyCharm\\template\\candb.py'''
-sp.call([bc] + sys.argv[1:], shell=True)
+# candb runs in this interpreter rather than as a second process, and run_module() loads it
+# from its compiled __pycache__ file instead of re-compiling it. It runs as __main__ (with
+# alter_sys), so processes spawned by load(workers=) import candb instead of this script.
+import runpy
+sys.path.insert(0, os.path.dirname(bc))
+runpy.run_module('candb', run_name='__main__', alter_sys=True)
 
 rem = """
 :endofPython """
\ No newline at end of file
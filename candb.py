@@ -36,8 +36,11 @@ Updates 18-Feb-2020
 ----   2. Many of the message and signal attributes dump in a different order than how they are read (due to the way the attributes are stored).
 """
 import re
-import xlrd
 import sys
+import math
+import bisect
+import struct
+import collections
 #imort importlib
 #import traceback
 import os
@@ -51,6 +54,8 @@ import os
 #else:
 #    importlib.reload(sys)
 
+### xlrd and the modules of the bigger subcommands are imported where they are used, to keep start-up short.
+
 # enable or disable debug info display, this switch is controlled by -d option.
 debug_enable = False
 
@@ -174,9 +179,104 @@ MATRIX_TEMPLATE_MAP = {
 # excel workbook sheets with name in this list are ignored
 MATRIX_SHEET_IGNORE = ["Cover", "History", "Legend", "ECU Version", ]
 
+# columns written by CanNetwork.to_xlsx(), in this order and followed by one column per
+# node, with the first header of MATRIX_TEMPLATE_MAP (parse_template() needs "MsgName" first)
+MATRIX_EXPORT_COLUMNS = ["msg_name_col", "msg_type_col", "msg_id_col", "msg_send_type_col", "msg_cycle_col", "msg_len_col",
+                         "sig_name_col", "sig_mltplx_col", "sig_comment_col", "sig_byte_order_col", "sig_start_bit_col",
+                         "sig_len_col", "sig_value_type_col", "sig_factor_col", "sig_offset_col", "sig_min_phys_col",
+                         "sig_max_phys_col", "sig_init_val_col", "sig_unit_col", "sig_val_col"]
+
+# MsgType column by the VFrameFormat of a message
+MATRIX_MSG_TYPES = {"J1939PG": "J1939 PG (ext. ID)", "StandardCAN": "CAN Standard", "ExtendedCAN": "CAN Extended"}
+
 ### changed from 8 to 16 based on an example file.
 NODE_NAME_MAX = 16
 
+# compressed dbc and log files by extension: module (de)compressing them, see open_dbc()
+COMPRESSED_EXTENSIONS = {'.gz': 'gzip', '.xz': 'lzma', '.bz2': 'bz2'}
+
+# position of a signal in the frame, see signal_layout()
+SignalLayout = collections.namedtuple('SignalLayout', 'name intel shift mask length signed valtype factor offset')
+
+# problem found by CanNetwork.load(..., report) or CanNetwork.validate(), see ValidationReport
+ValidationIssue = collections.namedtuple('ValidationIssue', 'kind record detail source line')
+
+# read-only snapshot of a network, see CanNetwork.freeze()
+FrozenSignal = collections.namedtuple('FrozenSignal', 'name mux_indicator start_bit sig_len byte_order value_type valtype factor offset '
+                                                      'min max unit values receivers comment attrs layout mux_value '
+                                                      'mux_switch mux_ranges')
+FrozenMessage = collections.namedtuple('FrozenMessage', 'name msg_id dlc sender signals attrs receivers transmitters comment '
+                                                        'signals_by_name multiplexor mux_table')
+FrozenNode = collections.namedtuple('FrozenNode', 'name comment attrs')
+# SG_MUL_VAL_ record, signal is multiplexed by switch (a signal name) for its raw values in ranges ((low, high), ...)
+SgMulVal = collections.namedtuple('SgMulVal', 'msg_id signal switch ranges')
+FrozenAttrDef = collections.namedtuple('FrozenAttrDef', 'name object_type value_type min max default values')
+
+# record of the binary traffic files: time (s), msg_id (bit 31: extended), length, data
+BINARY_FRAME = struct.Struct('<dIB3x8s')
+
+# compiled decoder image (see CanNetwork.to_decoder_image(), DecoderImage), little endian: header, msg_ids
+# (ascending uint32), a record per message, signal, value table entry and multiplexing range, then the names
+# and texts (utf-8)
+IMAGE_MAGIC = b'CANDBIM2'     ### changed with every change of the layout
+IMAGE_HEADER = struct.Struct('<8sIIIIIIIIII')  ### magic, number of messages, signals, values, ranges,
+                                                ### offsets of msg_ids, messages, signals, values, ranges, strings
+IMAGE_MESSAGE = struct.Struct('<IHHhIH')        ### first signal, signals, dlc, multiplexor (signal of the message, -1: none,
+                                                ### -2: extended multiplexing), name offset, length
+IMAGE_SIGNAL = struct.Struct('<BBHihHIddIHII')  ### flags (1: intel, 2: signed, valtype << 2), length, shift, mux value (-1: none),
+                                                ### switch (signal of the message, -1: none), ranges, first range (extended multiplexing),
+                                                ### factor, offset, name offset, length, first value, values
+IMAGE_VALUE = struct.Struct('<qIH')             ### value (ascending per signal), text offset, length
+IMAGE_RANGE = struct.Struct('<qq')              ### lowest, highest raw value of the switch
+
+# frame read from a traffic log (see read_log()), msg_id has bit 31 set for extended ids
+CanFrame = collections.namedtuple('CanFrame', 'time channel msg_id data')
+
+# records belonging to one message, with the position of the msg_id token (see scan_dbc_records())
+MESSAGE_RECORDS = {'BO_': 1, 'BO_TX_BU_': 1, 'CM_': 2, 'BA_': 3, 'VAL_': 1, 'SIG_VALTYPE_': 1, 'SIG_GROUP_': 1}
+
+# sections of the dbc text listing messages, in the order they are written (see CanNetwork._dbc_chunks())
+MESSAGE_SECTIONS = ('BO_', 'BO_TX_BU_', 'CM_', 'BA_BO_', 'BA_SG_', 'VAL_', 'SIG_VALTYPE_', 'SIG_GROUP_')
+
+# tables written by CanNetwork.to_sqlite(), signals are joined to the other signal tables by signal_id
+SQLITE_SCHEMA = '''
+CREATE TABLE network_attrs (name TEXT, value);
+CREATE TABLE attr_defs (name TEXT, object_type TEXT, value_type TEXT, min TEXT, max TEXT, default_value TEXT, enum_values TEXT);
+CREATE TABLE nodes (name TEXT, comment TEXT);
+CREATE TABLE node_attrs (node TEXT, name TEXT, value);
+CREATE TABLE messages (msg_id INTEGER, name TEXT, dlc INTEGER, sender TEXT, comment TEXT);
+CREATE TABLE message_transmitters (msg_id INTEGER, node TEXT);
+CREATE TABLE message_attrs (msg_id INTEGER, name TEXT, value);
+CREATE TABLE signals (signal_id INTEGER PRIMARY KEY, msg_id INTEGER, name TEXT, mux_indicator TEXT, start_bit INTEGER,
+                      sig_len INTEGER, byte_order TEXT, value_type TEXT, valtype INTEGER, factor REAL, offset REAL,
+                      min REAL, max REAL, unit TEXT, comment TEXT, spn INTEGER);
+CREATE TABLE signal_receivers (signal_id INTEGER, node TEXT);
+CREATE TABLE signal_attrs (signal_id INTEGER, name TEXT, value);
+CREATE TABLE signal_values (signal_id INTEGER, value INTEGER, description TEXT);
+CREATE TABLE val_tables (name TEXT, value INTEGER, description TEXT);
+CREATE TABLE envvars (name TEXT, ev_id INTEGER, env_var_type INTEGER, units TEXT, minimum REAL, maximum REAL, initial_value REAL, comment TEXT);
+CREATE VIEW message_receivers AS
+    SELECT DISTINCT signals.msg_id AS msg_id, signal_receivers.node AS node
+    FROM signals JOIN signal_receivers ON signals.signal_id = signal_receivers.signal_id;
+'''
+SQLITE_INDEXES = '''
+CREATE INDEX messages_msg_id ON messages (msg_id);
+CREATE INDEX messages_name ON messages (name);
+CREATE INDEX messages_sender ON messages (sender);
+CREATE INDEX message_transmitters_node ON message_transmitters (node);
+CREATE INDEX message_attrs_msg_id ON message_attrs (msg_id, name);
+CREATE INDEX message_attrs_value ON message_attrs (name, value);
+CREATE INDEX signals_msg_id ON signals (msg_id);
+CREATE INDEX signals_name ON signals (name);
+CREATE INDEX signals_spn ON signals (spn);
+CREATE INDEX signal_receivers_node ON signal_receivers (node);
+CREATE INDEX signal_receivers_signal_id ON signal_receivers (signal_id);
+CREATE INDEX signal_attrs_signal_id ON signal_attrs (signal_id, name);
+CREATE INDEX signal_attrs_value ON signal_attrs (name, value);
+CREATE INDEX signal_values_signal_id ON signal_values (signal_id);
+CREATE INDEX node_attrs_node ON node_attrs (node);
+'''
+
 def whoami():
     thisscript = os.path.basename(__file__)
     thisfunc = sys._getframe(1).f_code.co_name
@@ -362,6 +462,57 @@ def parse_sig_vals(val_str):
         return None
 
 
+def open_dbc(path, mode='r', newline=None):
+    """
+    open_dbc(path, mode='r', newline=None) -> file object, to be used with "with"
+
+    Open a dbc (or log) file. path may be a file object (used as it is and left open),
+    '-' for stdin/stdout (left open too), or a path ending with one of
+    COMPRESSED_EXTENSIONS, which is (de)compressed while it is read or written.
+    mode is 'r', 'w', 'rb' or 'wb'.
+    """
+    import contextlib
+    binary = 'b' in mode
+    if isinstance(path, os.PathLike):
+        path = os.fspath(path)
+    if path == '-':
+        path = sys.stdin if mode[0] == 'r' else sys.stdout
+    if not isinstance(path, str):
+        if binary and hasattr(path, 'buffer'):
+            path = path.buffer      ### bytes through a text stream, e.g. stdout
+        return contextlib.nullcontext(path)
+    module = COMPRESSED_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if module is not None:
+        import importlib
+        opener = importlib.import_module(module).open
+        return opener(path, mode) if binary else opener(path, mode + 't', newline=newline)
+    return open(path, mode) if binary else open(path, mode, newline=newline)
+
+
+def file_name(path):
+    """
+    file_name(path) -> name of a path or file object for messages, '-' for stdin/stdout
+    """
+    if isinstance(path, (str, os.PathLike)):
+        return os.fspath(path)
+    return getattr(path, 'name', '-')
+
+
+def excel_number(value):
+    """
+    excel_number(value) -> number of an excel cell
+
+    Numeric cells are floats already, numbers typed as text become a DbcNumber
+    (which keeps the text). Other text is returned unchanged.
+    """
+    if isinstance(value, str):
+        try:
+            return DbcNumber(value)
+        except ValueError:
+            return value
+    return value
+
+
 def getint(strng, default=None):
     """
     getint(strng) -> int
@@ -386,6 +537,77 @@ def getint(strng, default=None):
             except:
                 raise
 
+def getfloat(value, default):
+    """
+    getfloat(value, default) -> float
+
+    Convert a number (or its text) to float. default is returned for None and blank
+    text, e.g. an empty Min/Max cell of an excel matrix (see excel_number()).
+    """
+    if value is None or (isinstance(value, str) and value.strip() == ''):
+        return default
+    return float(value)
+
+class ValueTable(dict):
+    '''
+    Value table {integer: description} which can not be changed, so one object can be
+    shared by all the signals (and VAL_TABLE_ entries) with the same values, see
+    CanNetwork.intern_values(). Copies and deep copies return the table itself.
+    '''
+    def _immutable(self, *args, **kwargs):
+        raise TypeError(whoami() + " value tables are shared, assign a new table instead of changing it")
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _immutable
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (ValueTable, (dict(self),))
+
+
+class DbcNumber(float):
+    '''
+    Number read from a dbc file (signal factor, offset, min and max), which keeps the
+    text it was read from: it calculates and compares as a float, but str() gives the
+    text back, so the dbc is written unchanged (e.g. "0.1" or "1e-3", not "0.001").
+    '''
+    __slots__ = ('text',)
+
+    def __new__(cls, text):
+        number = float.__new__(cls, text)
+        number.text = text.strip() if isinstance(text, str) else str(text)
+        return number
+
+    def __str__(self):
+        return self.text
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (DbcNumber, (self.text,))
+
+
+def values_text(values):
+    '''
+    values_text(values) -> 'number "description" ...' as written by VAL_ and VAL_TABLE_
+
+    The text of a ValueTable is rendered once and kept with the table.
+    '''
+    text = getattr(values, '_text', None)
+    if text is None:
+        text = ' '.join(str(key) + ' "' + values[key] + '"' for key in values)
+        if isinstance(values, ValueTable):
+            values._text = text
+    return text
+
 #def motorola_msb_2_motorola_backward(start_bit, sig_size, frame_size):
 #    msb_bytes            = start_bit//8
 #    msb_byte_bit         = start_bit%8
@@ -410,86 +632,156 @@ class CanNetwork(object):
         self.val_tables = []        ### list of dictionaries - valtablename : { number: text, ...}
         self.version = ''
         self.new_symbols = NEW_SYMBOLS
-        self.attr_defs = []
+        self._attr_defs = None if init else []   ### built from ATTR_DEFS_INIT when first used
         self.attrs = {}              ###  list of attrs[namestring] = valuestring
         self.envvars = []
         self._filename = ''
-        self.sg_mul_val_items = []   # "SG_MUL_VAL_" items are not parsed, but simply pulled in and dumped
+        self.sg_mul_val_items = []   # "SG_MUL_VAL_" items are kept as read and dumped, see sg_mul_vals()
+        self._index = None           ### NetworkIndex, built by index() and dropped by the methods changing the network
+        self._value_tables = {}      ### shared ValueTable objects by their items, see intern_values()
         
         if init:
-            self._init_attr_defs()
-            for attr in self.attr_defs:
-                if attr.name == "DBName":
-                    self.attrs["DBName"] = attr.default
+            for attr_def in ATTR_DEFS_INIT:
+                if attr_def[1] == "DBName":
+                    self.attrs["DBName"] = attr_def[5]
                     break
 
+    @property
+    def attr_defs(self):
+        if self._attr_defs is None:
+            self._attr_defs = []
+            self._init_attr_defs()
+        return self._attr_defs
+
+    @attr_defs.setter
+    def attr_defs(self, attr_defs):
+        self._attr_defs = attr_defs
+
     def _init_attr_defs(self):
         for attr_def in ATTR_DEFS_INIT:
             self.attr_defs.append(CanAttribution(attr_def[1], attr_def[0], attr_def[2], attr_def[3], attr_def[4],
                                                  attr_def[5], attr_def[6], attr_def[7]))
             
     def __str__(self):
-        # ! version
-        lines = ['VERSION ' + r'""']
-        lines.append('\n\n\n')
-
-        # ! new_symbols
-        lines.append('NS_ :\n')
-        for symbol in self.new_symbols:
-            lines.append('    ' + symbol + '\n')
-        lines.append('\n')
-
-        # ! bit_timming
-        lines.append("BS_:\n")
-        lines.append('\n')
-
-        # ! nodes
-        line = ['BU_:']
-        if len(self.nodeobjects) > 0:
-            for node in self.nodeobjects:
-                line.append(node.name)
-        lines.append(' '.join(line) + '\n')
-        lines.append('\n')
+        return ''.join(text for section, text in self._dbc_chunks(self.messages))
+
+    def intern_values(self, values):
+        '''
+        Return the network's shared ValueTable with the same items (in the same order)
+        as values, which becomes the shared table if there is none yet. None for None.
+        '''
+        if values is None:
+            return None
+        key = tuple(values.items())
+        table = self._value_tables.get(key)
+        if table is None:
+            table = values if isinstance(values, ValueTable) else ValueTable(values)
+            self._value_tables[key] = table
+        return table
+
+    def shared_val_tables(self, messages=None):
+        '''
+        Return [{name: ValueTable}] with the value tables of the network (VAL_TABLE_) and
+        the value tables shared by several signals of messages (default all messages).
+        The latter are named after the first signal using them, e.g. 'VtSig_EngSpeed'.
+        '''
+        val_tables = list(self.val_tables)
+        known = set(id(values) for valtbl in self.val_tables for values in valtbl.values())
+        names = set(name for valtbl in self.val_tables for name in valtbl)
+        users = {}      ### id(values): [first signal name, count, values]
+        for msg in (self.messages if messages is None else messages):
+            for sig in msg.signals:
+                if isinstance(sig.values, ValueTable) and len(sig.values) > 0 and id(sig.values) not in known:
+                    user = users.setdefault(id(sig.values), [sig.name, 0, sig.values])
+                    user[1] += 1
+        for first_name, count, values in users.values():
+            if count > 1:
+                name = 'VtSig_' + first_name
+                num = 2
+                while name in names:
+                    name = 'VtSig_' + first_name + '_' + str(num)
+                    num += 1
+                names.add(name)
+                val_tables.append({name: values})
+        return val_tables
+
+    def _dbc_chunks(self, messages, with_globals=True, val_tables=False):
+        '''
+        Generate the dbc text as (section, text) chunks. section is None for text which
+        does not depend on messages, else the name of a section listing messages
+        (one of MESSAGE_SECTIONS), rendered for the given messages only.
+        with_globals=False leaves out the chunks which do not depend on messages.
+        val_tables=True also writes the value tables shared by several signals as
+        VAL_TABLE_ (see shared_val_tables()).
+        '''
+        if with_globals:
+            # ! version
+            lines = ['VERSION ' + r'""']
+            lines.append('\n\n\n')
+
+            # ! new_symbols
+            lines.append('NS_ :\n')
+            for symbol in self.new_symbols:
+                lines.append('    ' + symbol + '\n')
+            lines.append('\n')
+
+            # ! bit_timming
+            lines.append("BS_:\n")
+            lines.append('\n')
+
+            # ! nodes
+            line = ['BU_:']
+            if len(self.nodeobjects) > 0:
+                for node in self.nodeobjects:
+                    line.append(node.name)
+            lines.append(' '.join(line) + '\n')
+            lines.append('\n')
         
-        # ! Value tables, if any
-        for valtbl in self.val_tables: 
-            for valtablename in valtbl:
-                line = ["VAL_TABLE_"]
-                line.append(valtablename)
-                myvalstring = ''
-                for val_key in valtbl[valtablename]:
-                    myvalstring += " " + str(val_key) + ' \"' + valtbl[valtablename][val_key] + '\"'
-                line.append(myvalstring)
-                lines.append(' '.join(line) + ';\n')
-        lines.append('\n')
+            # ! Value tables, if any
+            for valtbl in (self.shared_val_tables(messages) if val_tables else self.val_tables):
+                for valtablename in valtbl:
+                    line = ["VAL_TABLE_"]
+                    line.append(valtablename)
+                    myvalstring = values_text(valtbl[valtablename])
+                    line.append(' ' + myvalstring if myvalstring else '')
+                    lines.append(' '.join(line) + ';\n')
+            lines.append('\n')
+            yield None, ''.join(lines)
 
         # ! messages
-        for msg in self.messages:
+        lines = []
+        for msg in messages:
             lines.append(str(msg) + '\n\n')
         #lines.append('\n')
+        yield 'BO_', ''.join(lines)
 
         # ! message transmitters
-        for msg in self.messages: 
+        lines = []
+        for msg in messages: 
             if len(msg.transmitters) > 0:
                 line = ["BO_TX_BU_"]
                 line.append(str(msg.msg_id))
                 line.append(':')
                 line.append(msg.get_transmitters())
                 lines.append(' '.join(line) + ';\n')
-        lines.append('\n')
+        yield 'BO_TX_BU_', ''.join(lines)
+        if with_globals:
+            lines = ['\n']
         
-        # ! environment variables
-        for envvar in self.envvars:
-            lines.append(str(envvar) + '\n')
-        lines.append('\n')
-
-        # ! comments
-        lines.append('''CM_ "Content processed by CANdb.py as forked by Soothsmith"''' + ";" + "\n")
-        for node in self.nodeobjects: 
-            if node.comment != '':
-                line = ['CM_', 'BU_', node.name, '\"' + node.comment + '\";']
-                lines.append(' '.join(line) + '\n')
-        for msg in self.messages:
+            # ! environment variables
+            for envvar in self.envvars:
+                lines.append(str(envvar) + '\n')
+            lines.append('\n')
+
+            # ! comments
+            lines.append('''CM_ "Content processed by CANdb.py as forked by Soothsmith"''' + ";" + "\n")
+            for node in self.nodeobjects: 
+                if node.comment != '':
+                    line = ['CM_', 'BU_', node.name, '\"' + node.comment + '\";']
+                    lines.append(' '.join(line) + '\n')
+            yield None, ''.join(lines)
+        lines = []
+        for msg in messages:
             comment = msg.comment
             if comment != "":
                 line = ['CM_', 'BO_', str(msg.msg_id), '\"' + comment + '\";']
@@ -499,103 +791,109 @@ class CanNetwork(object):
                 if comment != "":
                     line = ['CM_', 'SG_', str(msg.msg_id), sig.name, '\"' + comment + '\";']
                     lines.append(' '.join(line) + '\n')
-        for envvar in self.envvars:
-            comment = envvar.comment
-            if comment != '':
-                line = ['CM_', 'EV_', str(envvar.env_var_name), '\"' + comment + '\";']
-                lines.append(' '.join(line) + '\n')
+        yield 'CM_', ''.join(lines)
+        if with_globals:
+            lines = []
+            for envvar in self.envvars:
+                comment = envvar.comment
+                if comment != '':
+                    line = ['CM_', 'EV_', str(envvar.env_var_name), '\"' + comment + '\";']
+                    lines.append(' '.join(line) + '\n')
 
-        # ! attribution defines
-        for attr_def in self.attr_defs:
-            if attr_def.mode == True:
-                if attr_def.object_type == "NodeMappedRXSignal":
-                    line = ["BA_DEF_REL_ BU_SG_REL_"]
-                else:
-                    line = ["BA_DEF_"]
-                obj_type = attr_def.object_type
-                if (obj_type == "Node"):
-                    line.append("BU_")
-                elif (obj_type == "Message"):
-                    line.append("BO_")
-                elif (obj_type == "Signal"):
-                    line.append("SG_")
-                ##elif (obj_type == "Network")
-                line.append(" \"" + attr_def.name + "\"")
-                val_type = attr_def.value_type
-                if (val_type.upper() == "ENUMERATION"):
-                    line.append("ENUM")
-                    val_range = []
-                    for val in attr_def.values:                  ### This list may be merged from multiple files, so values may not be the same in output files. 
-                        val_range.append("\"" + val + "\"")
-                    line.append(",".join(val_range) + ";")
-                elif (val_type.upper() == "STRING"):
-                    line.append("STRING" + " " + ";")
-                elif (val_type.upper() == "HEX"):
-                    line.append("HEX")     ### by definition, the HEX min/max are represented as integers
-                    line.append(str(attr_def.min))
-                    line.append(str(attr_def.max) + ";")
-                elif (val_type.upper() == "INTEGER"):
-                    line.append("INT")
-                    line.append(str(attr_def.min))
-                    line.append(str(attr_def.max) + ";")
-                elif (val_type.upper() == "FLOAT"):
-                    line.append("FLOAT")
-                    strmin  = str(int(attr_def.min)) if (attr_def.min == float(int(attr_def.min))) else str(attr_def.min)
-                    strmax  = str(int(attr_def.max)) if (attr_def.max == float(int(attr_def.max))) else str(attr_def.max)
-                    line.append(strmin)
-                    line.append(strmax + ';')
-                lines.append(" ".join(line) + '\n')
-
-        # ! attribution default values
-        for attr_def in self.attr_defs:
-            if attr_def.mode == True:
-                if attr_def.object_type == "NodeMappedRXSignal":
-                    line = ["BA_DEF_DEF_REL_"]
-                else: 
-                    line = ["BA_DEF_DEF_"]
-                line.append(" \"" + attr_def.name + "\"")
-                val_type = attr_def.value_type.upper()
-                if (val_type == "ENUMERATION"):
-                    line.append("\"" + attr_def.default + "\"" + ";")
-                elif (val_type == "STRING"):
-                    line.append("\"" + attr_def.default + "\"" + ";")
-                elif (val_type == "HEX"):
-                    line.append(str(attr_def.default) + ";")
-                elif (val_type == "INTEGER"):
-                    line.append(str(attr_def.default) + ";")
-                elif (val_type == "FLOAT"):
-                    default   = str(int(attr_def.default)) if (attr_def.default == float(int(attr_def.default))) else str(attr_def.default)
-                    line.append(default + ";")
-                else:
-                    line.append('\"' + str(self.attrs_def.default) + '\";')
-                lines.append(" ".join(line) + '\n')
-
-        # ! attribution values of network
-        for atrdefs in self.attr_defs:
-            if atrdefs.object_type == "Network" and atrdefs.mode == True:
-                for atr in self.attrs:
-                    if atr == atrdefs.name:
-                        val_type = attr_def.value_type.upper()
-                        line = ["BA_"]
-                        line.append('\"' + atr + '\"')
-                        if val_type == "INTEGER":
-                            attrvalue = self.attrs[atr]
-                            ###strattrval  = str(int(attrvalue)) if (attrvalue == float(int(attrvalue))) else str(attrvalue)
-                            line.append(str(attrvalue) + ';')
-                        elif val_type == "STRING":
-                            line.append('\"' + self.attrs[atr] + '\";')
-                        elif val_type == "HEX":  ### HEX values are stored and represented as integers.
-                            line.append(str('0x' + self.attrs[atr] + ';'))
-                        else:
-                            line.append('\"' + self.attrs[atr] + '\";')
-                        lines.append(" ".join(line) + '\n')
+            # ! attribution defines
+            for attr_def in self.attr_defs:
+                if attr_def.mode == True:
+                    if attr_def.object_type == "NodeMappedRXSignal":
+                        line = ["BA_DEF_REL_ BU_SG_REL_"]
+                    else:
+                        line = ["BA_DEF_"]
+                    obj_type = attr_def.object_type
+                    if (obj_type == "Node"):
+                        line.append("BU_")
+                    elif (obj_type == "Message"):
+                        line.append("BO_")
+                    elif (obj_type == "Signal"):
+                        line.append("SG_")
+                    ##elif (obj_type == "Network")
+                    line.append(" \"" + attr_def.name + "\"")
+                    val_type = attr_def.value_type
+                    if (val_type.upper() == "ENUMERATION"):
+                        line.append("ENUM")
+                        val_range = []
+                        for val in attr_def.values:                  ### This list may be merged from multiple files, so values may not be the same in output files. 
+                            val_range.append("\"" + val + "\"")
+                        line.append(",".join(val_range) + ";")
+                    elif (val_type.upper() == "STRING"):
+                        line.append("STRING" + " " + ";")
+                    elif (val_type.upper() == "HEX"):
+                        line.append("HEX")     ### by definition, the HEX min/max are represented as integers
+                        line.append(str(attr_def.min))
+                        line.append(str(attr_def.max) + ";")
+                    elif (val_type.upper() == "INTEGER"):
+                        line.append("INT")
+                        line.append(str(attr_def.min))
+                        line.append(str(attr_def.max) + ";")
+                    elif (val_type.upper() == "FLOAT"):
+                        line.append("FLOAT")
+                        strmin  = str(int(attr_def.min)) if (attr_def.min == float(int(attr_def.min))) else str(attr_def.min)
+                        strmax  = str(int(attr_def.max)) if (attr_def.max == float(int(attr_def.max))) else str(attr_def.max)
+                        line.append(strmin)
+                        line.append(strmax + ';')
+                    lines.append(" ".join(line) + '\n')
+
+            # ! attribution default values
+            for attr_def in self.attr_defs:
+                if attr_def.mode == True:
+                    if attr_def.object_type == "NodeMappedRXSignal":
+                        line = ["BA_DEF_DEF_REL_"]
+                    else: 
+                        line = ["BA_DEF_DEF_"]
+                    line.append(" \"" + attr_def.name + "\"")
+                    val_type = attr_def.value_type.upper()
+                    if (val_type == "ENUMERATION"):
+                        line.append("\"" + attr_def.default + "\"" + ";")
+                    elif (val_type == "STRING"):
+                        line.append("\"" + attr_def.default + "\"" + ";")
+                    elif (val_type == "HEX"):
+                        line.append(str(attr_def.default) + ";")
+                    elif (val_type == "INTEGER"):
+                        line.append(str(attr_def.default) + ";")
+                    elif (val_type == "FLOAT"):
+                        default   = str(int(attr_def.default)) if (attr_def.default == float(int(attr_def.default))) else str(attr_def.default)
+                        line.append(default + ";")
+                    else:
+                        line.append('\"' + str(self.attrs_def.default) + '\";')
+                    lines.append(" ".join(line) + '\n')
+
+            # ! attribution values of network
+            for atrdefs in self.attr_defs:
+                if atrdefs.object_type == "Network" and atrdefs.mode == True:
+                    for atr in self.attrs:
+                        if atr == atrdefs.name:
+                            val_type = attr_def.value_type.upper()
+                            line = ["BA_"]
+                            line.append('\"' + atr + '\"')
+                            if val_type == "INTEGER":
+                                attrvalue = self.attrs[atr]
+                                ###strattrval  = str(int(attrvalue)) if (attrvalue == float(int(attrvalue))) else str(attrvalue)
+                                line.append(str(attrvalue) + ';')
+                            elif val_type == "STRING":
+                                line.append('\"' + self.attrs[atr] + '\";')
+                            elif val_type == "HEX":  ### HEX values are stored and represented as integers.
+                                line.append(str('0x' + self.attrs[atr] + ';'))
+                            else:
+                                line.append('\"' + self.attrs[atr] + '\";')
+                            lines.append(" ".join(line) + '\n')
                         
-        # ! node attributes "BA_ attr BU_ node..."
-        for node in self.nodeobjects:
-            lines.append(str(node))
+            # ! node attributes "BA_ attr BU_ node..."
+            for node in self.nodeobjects:
+                lines.append(str(node))
         
+            yield None, ''.join(lines)
+
         # ! message attribution values
-        for msg in self.messages:
+        lines = []
+        for msg in messages:
             for attr_def in self.attr_defs:
                 if attr_def.name in msg.attrs:
                     if (msg.attrs[attr_def.name] != ''):
@@ -612,8 +910,11 @@ class CanNetwork(object):
                             line.append(str(msg.attrs[attr_def.name]) + ";")
                         lines.append(" ".join(line) + '\n')
                         
+        yield 'BA_BO_', ''.join(lines)
+
         # ! signal attribution values
-        for msg in self.messages:
+        lines = []
+        for msg in messages:
             for sig in msg.signals:
                 for attr_def in self.attr_defs:
                     if attr_def.name in sig.attrs:
@@ -633,29 +934,37 @@ class CanNetwork(object):
                                 line.append(str(strattrval) + ';')
                             lines.append(' '.join(line) + '\n')
         
+        yield 'BA_SG_', ''.join(lines)
+
         # ! Signal Value tables
-        for msg in self.messages:
+        lines = []
+        for msg in messages:
             for sig in msg.signals:
                 if sig.values is not None and len(sig.values) >= 1:
                     line = ['VAL_']
                     line.append(str(msg.msg_id))
                     line.append(sig.name)
-                    for key in sig.values:
-                        line.append(str(key))
-                        line.append('"' + sig.values[key] + '"')
+                    line.append(values_text(sig.values))
                     line.append(';')
                     lines.append(' '.join(line) + '\n')
 
-        # ! Envronment variable value tables
-        for envvar in self.envvars:
-            if len(envvar.values) > 0: 
-                line = ['VAL_'] 
-                line.append(str(envvar.env_var_name))
-                line.append(envvar.get_values_str())
-                lines.append(' '.join(line) + ';\n')
+        yield 'VAL_', ''.join(lines)
+        if with_globals:
+
+            # ! Envronment variable value tables
+            lines = []
+            for envvar in self.envvars:
+                if len(envvar.values) > 0: 
+                    line = ['VAL_'] 
+                    line.append(str(envvar.env_var_name))
+                    line.append(envvar.get_values_str())
+                    lines.append(' '.join(line) + ';\n')
+
+            yield None, ''.join(lines)
 
         # ! Signal value types
-        for msg in self.messages:
+        lines = []
+        for msg in messages:
             for sig in msg.signals:
                 if sig.valtype is not None:
                     line = ['SIG_VALTYPE_']
@@ -664,25 +973,31 @@ class CanNetwork(object):
                     line.append(':')
                     line.append(str(sig.valtype))
                     lines.append(' '.join(line) + ';\n')
+        yield 'SIG_VALTYPE_', ''.join(lines)
                     
-        for msg in self.messages:
+        lines = []
+        for msg in messages:
             for sig_group in msg.sig_groups:
                 if sig_group.name != '':
                     line = ['SIG_GROUP_']
                     line.append(str(msg.msg_id))
                     line.append(str(sig_group))
                     lines.append(' '.join(line) + ';\n')
+        yield 'SIG_GROUP_', ''.join(lines)
+        if with_globals:
 
-        for sg_mul_val_item in self.sg_mul_val_items:
-            lines.append(sg_mul_val_item + '\n')
+            lines = []
+            for sg_mul_val_item in self.sg_mul_val_items:
+                lines.append(sg_mul_val_item + '\n')
             
-        return ''.join(lines)
+            yield None, ''.join(lines)
     
 #EnumerationListTypes    = {'DiagRequest': Boolean_List,  'DiagResponse': Boolean_List,  'DiagState': Boolean_List,  'GenMsgSendType': GenMsgSendType_List,  'GenMsgILSupport': Boolean_List, 
 #                           'NmMessage':   Boolean_List,  'ILUsed':       Boolean_List,  'SigType':   SigType_List,  'GenSigSendType': GenSigSendType_List,  'GenSigILSupport': Boolean_List,  'VFrameFormat': VFrameFormat_List}
 #EnumerationOrderTypes    = {'DiagRequest': Boolean_Order, 'DiagResponse': Boolean_Order, 'DiagState': Boolean_Order, 'GenMsgSendType': GenMsgSendType_Order, 'GenMsgILSupport': Boolean_Order, 
 #                           'NmMessage':   Boolean_Order, 'ILUsed':       Boolean_Order, 'SigType':   SigType_Order, 'GenSigSendType': GenSigSendType_Order, 'GenSigILSupport': Boolean_Order, 'VFrameFormat': VFrameFormat_Order}
     def add_attr_def(self, name, object_type, value_type, minvalue, maxvalue, default, values=None):
+        self._index = None
         index = None
         for i in range (0, len(self.attr_defs)):
             if self.attr_defs[i].name.upper() == name.upper():
@@ -751,10 +1066,167 @@ class CanNetwork(object):
                 break
         return ret
 
+    def index(self):
+        '''
+        index() -> NetworkIndex
+
+        Return the lookup index of this network, building it when the network changed.
+        Methods of CanNetwork drop the index themselves, call invalidate_index() after
+        changing messages/signals directly.
+        '''
+        if self._index is None:
+            self._index = NetworkIndex(self)
+        return self._index
+
+    def invalidate_index(self):
+        self._index = None
+
+    def find_signals(self, name=None, prefix=None, unit=None, receiver=None, sender=None, keyword=None, attrs=None):
+        '''
+        find_signals(...) -> [(CanMessage, CanSignal), ...]
+
+        Signals matching all given criteria, in network order:
+            name:     exact signal name          prefix:  start of the signal name
+            unit:     exact unit                 keyword: word in the signal comment
+            receiver: node receiving the signal  sender:  sender/transmitter of the message
+            attrs:    {attribute name: value}, e.g. {"SPN": 190}
+        '''
+        return self.index().find_signals(name, prefix, unit, receiver, sender, keyword, attrs)
+
+    def find_messages(self, name=None, prefix=None, msg_id=None, receiver=None, sender=None, keyword=None, attrs=None):
+        '''
+        find_messages(...) -> [CanMessage, ...]
+
+        Messages matching all given criteria, in network order. receiver matches the
+        message receivers and the receivers of its signals, sender matches the sender
+        and the BO_TX_BU_ transmitters, keyword is a word of the message comment.
+        '''
+        return self.index().find_messages(name, prefix, msg_id, receiver, sender, keyword, attrs)
+
+    def validate(self, report=None):
+        '''
+        Check the whole network and return a ValidationReport (the given one, e.g. from
+        load(), or a new one): attribute values of the network, nodes, messages and signals
+        which are undefined, outside the min/max of their definition or not one of its
+        enumeration values, and senders, receivers and transmitters which are not nodes.
+        '''
+        if report is None:
+            report = ValidationReport()
+        attr_defs = dict((attr_def.name, attr_def) for attr_def in self.attr_defs)
+        nodes = set(node.name for node in self.nodeobjects)
+        nodes.add('Vector__XXX')
+
+        def check(record, attrs):
+            for name, value in attrs.items():
+                attr_def = attr_defs.get(name)
+                if attr_def is None:
+                    report.add('undefined attribute', record, "attribute \'{}\' is not defined".format(name))
+                    continue
+                value_type = str(attr_def.value_type).upper()
+                if value_type == 'ENUMERATION':
+                    values = [str(v).upper() for v in (attr_def.values or [])]
+                    text = str(value)
+                    if text.upper() not in values and not (text.isdigit() and int(text) < len(values)):
+                        report.add('out of range', record, "\'{}\' is not a value of attribute \'{}\' {}".format(value, name, attr_def.values))
+                elif value_type in ('INTEGER', 'FLOAT', 'HEX'):
+                    try:
+                        number = float(value)
+                    except (ValueError, TypeError):
+                        report.add('invalid value', record, "\'{}\' of attribute \'{}\' is not a number".format(value, name))
+                        continue
+                    low, high = attr_def.min, attr_def.max
+                    if low not in ('', None) and high not in ('', None) and not (float(low) == 0 and float(high) == 0):
+                        if number < float(low) or number > float(high):     ### min = max = 0 means no limits
+                            report.add('out of range', record, "{} of attribute \'{}\' is outside [{}, {}]".format(value, name, low, high))
+
+        check('BA_', self.attrs)
+        for node in self.nodeobjects:
+            check('BA_ BU_ ' + node.name, node.attrs)
+        for msg in self.messages:
+            record = 'BO_ ' + str(msg.msg_id)
+            check('BA_ ' + record, msg.attrs)
+            if msg.sender not in nodes:
+                report.add('unknown node', record, "sender \'{}\' is not a node".format(msg.sender))
+            for transmitter in msg.transmitters:
+                if transmitter not in nodes:
+                    report.add('unknown node', 'BO_TX_BU_ ' + str(msg.msg_id), "transmitter \'{}\' is not a node".format(transmitter))
+            for sig in msg.signals:
+                check('BA_ SG_ ' + str(msg.msg_id) + ' ' + sig.name, sig.attrs)
+                for receiver in sig.receivers:
+                    if receiver not in nodes:
+                        report.add('unknown node', 'SG_ ' + str(msg.msg_id) + ' ' + sig.name, "receiver \'{}\' is not a node".format(receiver))
+        return report
+
+    def sg_mul_vals(self, msg_id=None):
+        '''
+        Return the extended multiplexing records (SG_MUL_VAL_, kept as read in
+        sg_mul_val_items) as SgMulVal(msg_id, signal, switch, ranges), of msg_id or all.
+        '''
+        items = []
+        for line in self.sg_mul_val_items:
+            item = parse_sg_mul_val(line)
+            if item is not None and (msg_id is None or item.msg_id == msg_id):
+                items.append(item)
+        return items
+
+    def freeze(self, pool=None):
+        '''
+        Return a FrozenNetwork, a read-only snapshot of the network with indexes by msg_id
+        and names, which threads can share without locks. Later changes of the network
+        do not change the snapshot. Snapshots made with the same pool dict share equal
+        value tables.
+        '''
+        return FrozenNetwork(self, pool)
+
+    def split_by_node(self, nodes=None):
+        '''
+        split_by_node(nodes=None) -> {node name: CanNetwork}
+
+        Build one network per node holding the messages the node sends (sender or
+        BO_TX_BU_ transmitter) or receives (message or signal receiver).
+        Membership of all nodes is collected in one pass over the messages.
+        The networks share message, attribute definition and value table objects
+        with this network, so they are meant for writing out, not for changing.
+        nodes limits the split to the given node names.
+        '''
+        if nodes is None:
+            nodes = [node.name for node in self.nodeobjects if node.name != 'Vector__XXX']
+        members = dict((name, []) for name in nodes)
+        related = dict((name, set([name])) for name in nodes)   ### nodes referenced by the messages of a node
+        for msg in self.messages:
+            msg_nodes = set([msg.sender] + list(msg.transmitters) + list(msg.receivers))
+            for sig in msg.signals:
+                msg_nodes.update(sig.receivers)
+            for name in msg_nodes:
+                if name in members:
+                    members[name].append(msg)
+                    related[name].update(msg_nodes)
+        networks = {}
+        for name in nodes:
+            can = CanNetwork(init=False)
+            can.name = self.name
+            can.version = self.version
+            can.new_symbols = self.new_symbols
+            can.attr_defs = self.attr_defs
+            can.attrs = dict(self.attrs)
+            can.val_tables = self.val_tables
+            can.messages = members[name]
+            can.nodeobjects = [node for node in self.nodeobjects if node.name in related[name]]
+            can.envvars = [envvar for envvar in self.envvars
+                           if name in re.split(r'[\s,]+', ' '.join(envvar.access_nodes))]
+            msg_ids = set(str(msg.msg_id) for msg in members[name])
+            can.sg_mul_val_items = [item for item in self.sg_mul_val_items if item.split()[1] in msg_ids]
+            networks[name] = can
+        return networks
+
     def append_message(self, canmessage):
+        self._index = None
         for msg in self.messages: 
             if msg.msg_id == canmessage.msg_id:
                 msg.merge(canmessage)
+                for sig in msg.signals:
+                    if sig.values and not isinstance(sig.values, ValueTable):   ### merged value tables
+                        sig.values = self.intern_values(sig.values)
                 return msg      ### CanMessage object
         ### if the above didn't find and merge a message, then add the new one
         self.messages.append(canmessage)
@@ -762,23 +1234,98 @@ class CanNetwork(object):
                 
                 
     def set_msg_attr(self, msg_id, attr_name, value):
+        self._index = None
         for msg in self.messages:
             if msg.msg_id == msg_id:
                 msg.set_attr(attr_name, value)
                 break
 
     def get_msg_attr(self, msg_id, attr_name):
-        value = None
+        '''
+        Return the attribute of a message, else the default of the attribute definition
+        (None without message or definition). The value is as stored, see effective_attrs().
+        '''
+        for msg in self.messages:
+            if msg.msg_id == msg_id:
+                if attr_name in msg.attrs:
+                    return msg.attrs[attr_name]
+                attr_def = self.get_attr_def(attr_name)
+                return attr_def.default if attr_def is not None else None
+        return None
+
+    def get_sig_attr(self, msg_id, sig_name, attr_name):
+        '''
+        Return the attribute of a signal, else the default of the attribute definition.
+        '''
         for msg in self.messages:
             if msg.msg_id == msg_id:
-                if msg.attrs.has_key(attr_name):
-                    value = msg.attrs[attr_name]
+                for sig in msg.signals:
+                    if sig.name == sig_name:
+                        if attr_name in sig.attrs:
+                            return sig.attrs[attr_name]
+                        attr_def = self.get_attr_def(attr_name)
+                        return attr_def.default if attr_def is not None else None
+        return None
+
+    def get_node_attr(self, node_name, attr_name):
+        '''
+        Return the attribute of a node, else the default of the attribute definition.
+        '''
+        for node in self.nodeobjects:
+            if node.name == node_name:
+                if attr_name in node.attrs:
+                    return node.attrs[attr_name]
+                attr_def = self.get_attr_def(attr_name)
+                return attr_def.default if attr_def is not None else None
+        return None
+
+    def effective_attrs(self, object_type, refresh=False):
+        '''
+        effective_attrs(object_type, refresh=False) -> AttrTable
+
+        Return the table of the effective attributes of all objects of object_type
+        ('Network', 'Node', 'Message' or 'Signal'): a column per attribute defined for
+        the type (or set without definition), with the default where an object has no
+        value, and values typed by the definition (see attr_value()). The table is kept
+        with the index (see index()) until a method of CanNetwork changes the network;
+        after CanMessage.set_attr(), CanSignal.set_attr() or writing attrs directly pass
+        refresh=True (or call invalidate_index()).
+        '''
+        tables = self.index().attr_tables
+        if refresh or object_type not in tables:
+            if object_type == 'Network':
+                keys, objects, attrs = [''], [self], [self.attrs]
+            elif object_type == 'Node':
+                keys = [node.name for node in self.nodeobjects]
+                objects = list(self.nodeobjects)
+                attrs = [node.attrs for node in objects]
+            elif object_type == 'Message':
+                keys = [msg.msg_id for msg in self.messages]
+                objects = list(self.messages)
+                attrs = [msg.attrs for msg in objects]
+            elif object_type == 'Signal':
+                objects = [(msg, sig) for msg in self.messages for sig in msg.signals]
+                keys = [(msg.msg_id, sig.name) for msg, sig in objects]
+                attrs = [sig.attrs for msg, sig in objects]
+            else:
+                raise ValueError(whoami() + " Unknown object type '{}', expected Network, Node, Message or Signal".format(object_type))
+            attr_defs = dict((attr_def.name, attr_def) for attr_def in self.attr_defs if attr_def.object_type == object_type)
+            names = list(attr_defs)
+            for object_attrs in attrs:
+                for name in object_attrs:
+                    if name not in attr_defs and name not in names:
+                        names.append(name)      ### set, but not defined for the type
+            columns = {}
+            for name in names:
+                attr_def = attr_defs.get(name)
+                if attr_def is None:
+                    columns[name] = [object_attrs.get(name) for object_attrs in attrs]
                 else:
-                    attr_def = self.get_attr_def(attr_name)
-                    if attr_def is not None:
-                        value = attr_def.default
-                        break
-        return value
+                    default = attr_value(attr_def, attr_def.default)
+                    columns[name] = [default if name not in object_attrs else attr_value(attr_def, object_attrs[name])
+                                     for object_attrs in attrs]
+            tables[object_type] = AttrTable(object_type, keys, objects, columns)
+        return tables[object_type]
 
     def set_sig_group(self, msg_id, name, repetitions=1, signals=[]):
         for msg in self.messages:
@@ -787,6 +1334,7 @@ class CanNetwork(object):
                 break
 
     def set_sig_attr(self, msg_id, sig_name, attr_name, attr_value):
+        self._index = None
         for msg in self.messages:
             if msg.msg_id == msg_id:
                 for sig in msg.signals:
@@ -856,6 +1404,7 @@ class CanNetwork(object):
             self.nodeobjects.append(nodeobject)
             
     def set_node_attribute(self, nodename, attrname, attrvalue):
+        self._index = None
         node_found = False
         for node in self.nodeobjects:
             if node.name == nodename:
@@ -867,6 +1416,7 @@ class CanNetwork(object):
             self.nodeobjects.append(nodeobject)
 
     def set_sig_comment(self, msg_id, signame, comment):
+        self._index = None
         for msg in self.messages: 
             if msg.msg_id == msg_id:
                 for signal in msg.signals:
@@ -875,6 +1425,7 @@ class CanNetwork(object):
                         break
     
     def append_sig_comment(self, msg_id, signame, comment):
+        self._index = None
         for msg in self.messages: 
             if msg.msg_id == msg_id:
                 for signal in msg.signals:
@@ -883,18 +1434,21 @@ class CanNetwork(object):
                         break
 
     def set_msg_comment(self, msg_id, comment):
+        self._index = None
         for msg in self.messages: 
             if msg.msg_id == msg_id:
                 msg.set_comment(comment)
                 break
 
     def append_msg_comment(self, msg_id, comment):
+        self._index = None
         for msg in self.messages: 
             if msg.msg_id == msg_id:
                 msg.append_comment(comment)
                 break
 
     def set_msg_transmitters(self, msg_id, transmitters=[]):
+        self._index = None
         for msg in self.messages: 
             if msg.msg_id == msg_id:
                 msg.transmitters = transmitters
@@ -919,6 +1473,7 @@ class CanNetwork(object):
                 break
 
     def sort(self, option='id'):
+        self._index = None
         messages = self.messages
         if option == 'id':
             # sort by msg_id, id is treated as string, NOT numbers, to keep the same with candb++
@@ -931,10 +1486,112 @@ class CanNetwork(object):
         else:
             raise ValueError(whoami() + "Invalid sort option \'{}\'".format(option))
 
-    def load(self, path):
-        print(whoami(), "Reading: ", path)
-        dbcline = (l.rstrip('\n') for l in open(path, 'r'))  ### generator to read lines from the file helps with multiline comments
-        
+    def load(self, path, report=None, workers=None):
+        '''
+        Load (merge) a dbc file into this network. path may also be '-' (stdin), a
+        file object or a compressed file (see open_dbc()). With a ValidationReport, records which
+        refer to unknown messages, signals, nodes, environment variables or attributes
+        are added to the report instead of being dropped silently (or raising).
+        With workers > 1 the messages are parsed by that many processes (see
+        load_parallel()), unless the network has messages already or a report is given.
+        '''
+        print(whoami(), "Reading: ", file_name(path))
+        with open_dbc(path) as file:
+            if workers is not None and workers > 1 and not self.messages and report is None:
+                self.load_parallel(file, workers, file_name(path))
+            else:
+                self.load_lines(file, report, file_name(path))
+
+    def load_parallel(self, lines, workers, source=''):
+        '''
+        Parse dbc text like load_lines() on a pool of worker processes, for a network
+        without messages. The records of the text are split (see scan_dbc_records()): the
+        records of no message (nodes, attribute definitions, value tables, ...) are parsed
+        first here, then the records of the messages, grouped by msg_id into workers parts
+        of consecutive BO_, are parsed by copies of this network in the workers. Their
+        messages are added in the order of the text, so the network is the same as after
+        load_lines().
+        '''
+        import concurrent.futures
+        import pickle
+        records = list(scan_dbc_records(lines))
+        total = sum(len(record) for keyword, target, msg_id, record in records if keyword == 'BO_')
+        owner = {}      ### msg_id: part
+        done = 0
+        for keyword, target, msg_id, record in records:
+            if keyword == 'BO_':
+                owner.setdefault(msg_id, min(workers - 1, done * workers // max(total, 1)))
+                done += len(record)
+        global_lines = []
+        parts = [[] for num in range(workers)]
+        for keyword, target, msg_id, record in records:
+            if msg_id is None:
+                global_lines.extend(record)
+            else:
+                parts[owner.get(msg_id, 0)].extend(record)
+        del records
+        self.load_lines(global_lines, None, source)
+        parts = [''.join(part) for part in parts if part]
+        network = pickle.dumps(self)    ### before the first messages are added, tasks are pickled while they run
+        with concurrent.futures.ProcessPoolExecutor(min(workers, len(parts) or 1)) as pool:
+            for messages in pool.map(load_message_records, [network] * len(parts), parts):
+                for msg in messages:
+                    for sig in msg.signals:
+                        if sig.values:
+                            sig.values = self.intern_values(sig.values)
+                    self.messages.append(msg)
+        self._index = None
+
+    def load_lines(self, lines, report=None, source=''):
+        '''
+        Parse dbc text given as an iterable of lines (e.g. an open file) into this network.
+        report (a ValidationReport) collects the dangling references, see load().
+        '''
+        line_num = [0]
+        def numbered(lines):
+            for line in lines:
+                line_num[0] += 1
+                yield line.rstrip('\n')
+        dbcline = numbered(lines)  ### generator to read lines from the file helps with multiline comments
+
+        ### hash indexes of what records may refer to, for the report
+        known_msgs = dict((msg.msg_id, msg) for msg in self.messages)
+        known_sigs = {}     ### msg_id: set of signal names, dropped when a signal is added
+        known_nodes = set(node.name for node in self.nodeobjects)
+        known_envs = set(envvar.env_var_name for envvar in self.envvars)
+
+        def dangling(record, msg_id, sig_name=None):
+            msg = known_msgs.get(msg_id)
+            if msg is None:
+                report.add('unknown message', record, "message {} is not defined".format(msg_id), source, line_num[0])
+                return True
+            if sig_name is not None:
+                names = known_sigs.get(msg_id)
+                if names is None:
+                    names = known_sigs[msg_id] = set(sig.name for sig in msg.signals)
+                if sig_name not in names:
+                    report.add('unknown signal', record, "signal \'{}\' is not defined in message {}".format(sig_name, msg_id), source, line_num[0])
+                    return True
+            return False
+
+        def unknown(kind, record, name, names):
+            if name not in names:
+                report.add(kind, record, "\'{}\' is not defined".format(name), source, line_num[0])
+                return True
+            return False
+
+        def convert(record, attr_name, value_str):
+            try:
+                return self.convert_attr_def_value(attr_name, value_str)
+            except (ValueError, IndexError) as error:
+                if report is None:
+                    raise
+                if self.get_attr_def(attr_name) is None:
+                    report.add('undefined attribute', record, "attribute \'{}\' is not defined".format(attr_name), source, line_num[0])
+                else:
+                    report.add('invalid value', record, "\'{}\' is not a value of attribute \'{}\'".format(value_str, attr_name), source, line_num[0])
+                return None
+
         for line in dbcline:
             line_rtrimmed = line.rstrip()                  ### will need line_rtrimmed when reading comments to preserve indent.
             line_trimmed = line_rtrimmed.lstrip()
@@ -957,6 +1614,7 @@ class CanNetwork(object):
                     for new_node_name in new_node_list: 
                         if new_node_name not in existing_node_name_list:
                             self.nodeobjects.append(Node(new_node_name))  # create list of Node objects
+                    known_nodes.update(new_node_list)
 
                 # Message
                 elif line_split[0] == 'BO_':
@@ -966,6 +1624,7 @@ class CanNetwork(object):
                     msg.dlc    = int(line_split[3])
                     msg.sender = line_split[4]
                     msg = self.append_message(msg)    # if merging files, need the pointer to the original message to append/merge signals
+                    known_msgs[msg.msg_id] = msg
                 # Signal
                 elif line_split[0] == 'SG_':
                     sig = CanSignal()     ### create object from class
@@ -980,15 +1639,16 @@ class CanNetwork(object):
                         sig.sig_len       = int(match.group(4))
                         sig.byte_order    = match.group(5)
                         sig.value_type    = match.group(6)
-                        sig.factor        = match.group(7)
-                        sig.offset        = match.group(8)
-                        sig.min           = match.group(9)
-                        sig.max           = match.group(10)
+                        sig.factor        = DbcNumber(match.group(7))
+                        sig.offset        = DbcNumber(match.group(8))
+                        sig.min           = DbcNumber(match.group(9))
+                        sig.max           = DbcNumber(match.group(10))
                         sig.unit          = match.group(11)
-                        sig.receivers     = list(re.split('\s+', match.group(12))) # split receivers to list
+                        sig.receivers     = list(re.split('[\s,]+', match.group(12))) # split receivers to list, they are comma separated
                         sig.use_name      = msg.name.upper() == 'VECTOR__INDEPENDENT_SIG_MSG'
                         if debug_enable: print(str(sig))
                     msg.add_signal(sig)
+                    known_sigs.pop(msg.msg_id, None)
                     
                 # read in comments from Messages, Signals or Nodes
                 elif line_split[0] == 'CM_':
@@ -1008,16 +1668,20 @@ class CanNetwork(object):
                         # save comment to message/signal
                         if comment_type == "BU_":
                             nodename   = match1.group(3)
+                            if report is not None: unknown('unknown node', 'CM_ BU_', nodename, known_nodes)
                             self.set_node_comment(nodename, comment_string)   ### nodes as list of objects
                         elif comment_type == "EV_":
                             envvar     = match1.group(3)
-                            self.set_env_comment(envvar, comment_string)             
+                            if report is None or not unknown('unknown environment variable', 'CM_ EV_', envvar, known_envs):
+                                self.set_env_comment(envvar, comment_string)             
                         elif comment_type == "BO_":
-                            self.set_msg_comment(message_id, comment_string)
+                            if report is None or not dangling('CM_ BO_', message_id):
+                                self.set_msg_comment(message_id, comment_string)
                             #print("BO_ one-liner", message_id, ":", new_comment)
                         elif comment_type == "SG_":
                             signal_name = match1.group(3)
-                            self.set_sig_comment(message_id, signal_name, comment_string)
+                            if report is None or not dangling('CM_ SG_', message_id, signal_name):
+                                self.set_sig_comment(message_id, signal_name, comment_string)
                     else: 
                         #               1=comment_type 2 = msg_id, 3 = signal name, 4 = comment content
                         match2 = re.match(r'CM_\s+(%s)\s+(\d+)\s+([\w\d_]*)\s*\"(.+)$' %comment_type, line) ### start of comment line but no "; to finish it
@@ -1053,15 +1717,19 @@ class CanNetwork(object):
                                                 #self.append_sig_comment(message_id, signal_name, comment_string + '\n')
                             if comment_type == "BU_":
                                 nodename = match2.group(3)
+                                if report is not None: unknown('unknown node', 'CM_ BU_', nodename, known_nodes)
                                 self.set_node_comment(nodename, new_comment)   ### nodes as list of objects
                             elif comment_type == "EV_":
                                 envvar   = match2.group(3)
-                                self.set_env_comment(envvar, new_comment)                                        
+                                if report is None or not unknown('unknown environment variable', 'CM_ EV_', envvar, known_envs):
+                                    self.set_env_comment(envvar, new_comment)                                        
                             elif comment_type == "BO_":
-                                self.set_msg_comment(message_id, new_comment)
+                                if report is None or not dangling('CM_ BO_', message_id):
+                                    self.set_msg_comment(message_id, new_comment)
                                 if debug_enable: print("BO_ ", message_id, ":", new_comment)
                             elif comment_type == "SG_":
-                                self.set_sig_comment(message_id, signal_name, new_comment)
+                                if report is None or not dangling('CM_ SG_', message_id, signal_name):
+                                    self.set_sig_comment(message_id, signal_name, new_comment)
                             
                 # Attribution Definition
                 elif line_split[0] == 'BA_DEF_':
@@ -1125,7 +1793,7 @@ class CanNetwork(object):
                 elif line_split[0] == 'BA_DEF_DEF_' or line_split[0] == "BA_DEF_DEF_REL_":
                     attr_def_name               = line_split[1][1:-1] #remove "
                     attr_def_value_type_str     = None
-                    attr_def_default            = self.convert_attr_def_value(attr_def_name, line_split[2])
+                    attr_def_default            = convert('BA_DEF_DEF_', attr_def_name, line_split[2])
                     attr_def                    = self.get_attr_def(attr_def_name)
                     if attr_def is not None and attr_def_default != None:
                         if attr_def_name in EnumerationListTypes.keys():
@@ -1146,20 +1814,26 @@ class CanNetwork(object):
                     attr_object         = line_split[2]
                     if attr_object == 'BO_':
                         attr_msg_id     = int(line_split[3])
-                        attr_value      = self.convert_attr_def_value(attr_name, line_split[4])
+                        attr_value      = convert('BA_ BO_', attr_name, line_split[4])
                         if attr_value is not None:
-                            self.set_msg_attr(attr_msg_id, attr_name, attr_value)
-                        else:
+                            if report is None or not dangling('BA_ BO_', attr_msg_id):
+                                self.set_msg_attr(attr_msg_id, attr_name, attr_value)
+                        elif report is None:
                             raise ValueError(whoami() + "Msg \'{}\' attribuition \'{}\' value is {}".format(attr_msg_id, attr_name, line_split[4])) 
                     elif attr_object == 'SG_':
                         attr_msg_id     = int(line_split[3])
                         signal_name     = line_split[4]
-                        attr_value      = self.convert_attr_def_value(attr_name, line_split[5])
+                        attr_value      = convert('BA_ SG_', attr_name, line_split[5])
                         if attr_value is not None: 
-                            self.set_sig_attr(attr_msg_id, signal_name, attr_name, attr_value)
+                            if report is None or not dangling('BA_ SG_', attr_msg_id, signal_name):
+                                self.set_sig_attr(attr_msg_id, signal_name, attr_name, attr_value)
                     elif attr_object == 'BU_':
                         nodename = line_split[3].strip()
                         attr_value = line_split[4]
+                        if report is not None:
+                            unknown('unknown node', 'BA_ BU_', nodename, known_nodes)
+                            if self.get_attr_def(attr_name) is None:
+                                report.add('undefined attribute', 'BA_ BU_', "attribute \'{}\' is not defined".format(attr_name), source, line_num[0])
                         ##attr_value      = self.convert_attr_def_value(attr_name, line_split[4])  ### should handle multiple attribute types, only handling as text string right now. # TO DO
                         if debug_enable: print("Attribute: ", attr_name, ",Node:", nodename, ",attr_value:", attr_value)
                         self.set_node_attribute(nodename, attr_name, attr_value)
@@ -1167,6 +1841,8 @@ class CanNetwork(object):
                         # network attribute: 
                         attr_name       = line_split[1][1:-1]
                         attr_value      = line_split[2].strip('\"')
+                        if report is not None and self.get_attr_def(attr_name) is None:
+                            report.add('undefined attribute', 'BA_', "attribute \'{}\' is not defined".format(attr_name), source, line_num[0])
                         self.attrs[attr_name] = attr_value
                         
                 # Value Tables
@@ -1208,14 +1884,16 @@ class CanNetwork(object):
                         if valtabletype == 'VAL_':
                             if val_msg_id == None:        ### Environment Variable value list
                                 env_var_name = text
-                                self.set_env_vals(env_var_name, values)
+                                if report is None or not unknown('unknown environment variable', 'VAL_', env_var_name, known_envs):
+                                    self.set_env_vals(env_var_name, values)
                             else:                         ### Message/Signal value list
                                 val_sig_name = text
-                                self.set_sig_attr(val_msg_id, val_sig_name, 'values', values)
+                                if report is None or not dangling('VAL_', val_msg_id, val_sig_name):
+                                    self.set_sig_attr(val_msg_id, val_sig_name, 'values', self.intern_values(values))
                         elif valtabletype == 'VAL_TABLE_': 
                             # reserved for VAL_TABLE_ type
                             vt_name = text
-                            namedvaltbl = {vt_name: values}
+                            namedvaltbl = {vt_name: self.intern_values(values)}
                             self.val_tables.append(namedvaltbl)
                         
                 elif line_split[0] == 'EV_':   ### environment variables
@@ -1236,13 +1914,15 @@ class CanNetwork(object):
                         ###                  name='',      ev_id= 0,   env_var_type=0, units='',      minimum=0,   maximum=0,  initial_value=0, access_type=0,   access_nodes=[]):
                         envvar = EnvVariable(env_var_name, env_var_id, env_var_type,   env_var_units, env_var_min, env_var_max, env_var_init,   env_var_acctype, env_var_nodes)
                         self.envvars.append(envvar)
+                        known_envs.add(env_var_name)
                         
                 elif line_split[0] == 'BO_TX_BU_':
                     match11 = re.match(r'BO_TX_BU_\s+(\d+)\s*\:\s+(.+);', line_trimmed)
                     if match11:
                         msg_id = int(match11.group(1))
-                        trans_msg_transmitters = match11.group(2).split(r'\,+')
-                        self.set_msg_transmitters(msg_id, trans_msg_transmitters)
+                        trans_msg_transmitters = re.split(r'[\s,]+', match11.group(2).strip())
+                        if report is None or not dangling('BO_TX_BU_', msg_id):
+                            self.set_msg_transmitters(msg_id, trans_msg_transmitters)
                         
                 elif line_split[0] == 'SIG_VALTYPE_':
                     match12  = re.match(r'SIG_VALTYPE_\s+(\d+)\s+(\w+)\s+\:\s+([\w\d]+)\s*;', line_trimmed)
@@ -1250,7 +1930,8 @@ class CanNetwork(object):
                         msg_id = int(match12.group(1))
                         signame = match12.group(2)
                         sigvaltype = int(match12.group(3))   ### 0:signed or unsigned integer, 1: 32-bit IEEE-float, 2: 64-bit IEEE-double
-                        self.set_sig_valtype(msg_id, signame, sigvaltype)
+                        if report is None or not dangling('SIG_VALTYPE_', msg_id, signame):
+                            self.set_sig_valtype(msg_id, signame, sigvaltype)
                         
                 elif line_split[0] == 'SIG_GROUP_':
                     match13 = re.match(r'SIG_GROUP_\s(\d+)\s+(\w+)\s+(\d+)\s+\:\s+(.+)\s*;', line_trimmed)
@@ -1260,7 +1941,8 @@ class CanNetwork(object):
                         repetitions    = int(match13.group(3))
                         signals_string = match13.group(4)
                         signals = re.split(r'\s+', signals_string)
-                        self.set_sig_group(msg_id, sig_group_name, repetitions, signals)
+                        if report is None or not dangling('SIG_GROUP_', msg_id):
+                            self.set_sig_group(msg_id, sig_group_name, repetitions, signals)
                         
                 elif line_split[0] == 'SG_MUL_VAL_':
                     self.sg_mul_val_items.append(line_trimmed)
@@ -1269,19 +1951,200 @@ class CanNetwork(object):
                     print("Unparsed: ", line_trimmed)
 
         dbcline.close()
+        self._index = None
                         
-    def save(self, path=None):
+    def save(self, path=None, val_tables=False):
+        '''
+        Write the network to path, which may also be '-' (stdout), a file object or a
+        compressed file (see open_dbc()). val_tables=True also writes the value tables
+        shared by several signals once as VAL_TABLE_ entries.
+        '''
         if (path == None):
-            file = open(self._filename + ".dbc", "w")
-            print("printing to:", self._filename + ".dbc")
-        else:
-            file = open(path, 'w')
-        # file.write(unicode.encode(str(self), "utf-8"))
-        file.write(str(self))
+            path = self._filename + ".dbc"
+            print("printing to:", path)
+        with open_dbc(path, 'w') as file:
+            # file.write(unicode.encode(str(self), "utf-8"))
+            file.write(''.join(text for section, text in self._dbc_chunks(self.messages, val_tables=val_tables)))
+
+    def matrix_rows(self):
+        '''
+        Generate the rows of the excel matrix read by import_excel(): the header
+        (MATRIX_EXPORT_COLUMNS and the nodes), then each message followed by its signals,
+        with "S"/"R" in the node columns for the sender and the receivers.
+        '''
+        def number(value):
+            value = float(value)
+            return int(value) if value.is_integer() else value
+
+        nodes = [node.name for node in self.nodeobjects]
+        for name in nodes:
+            if len(name) > NODE_NAME_MAX:
+                print(whoami(), "Warning: node name '{}' is longer than {} characters, import_excel ignores it".format(name, NODE_NAME_MAX))
+        yield [MATRIX_TEMPLATE_MAP[col_name][0] for col_name in MATRIX_EXPORT_COLUMNS] + nodes
+        cycle_def = self.get_attr_def("GenMsgCycleTime")
+        cycle_default = cycle_def.default if cycle_def is not None else 0
+        blank = [''] * len(MATRIX_EXPORT_COLUMNS)
+        for msg in self.messages:
+            row = list(blank)
+            frame_format = msg.attrs.get("VFrameFormat", "ExtendedCAN" if msg.msg_id & 0x80000000 else "StandardCAN")
+            row[0:6] = [msg.name, MATRIX_MSG_TYPES.get(frame_format, ''), '0x%X' % msg.msg_id,
+                        msg.attrs.get("GenMsgSendType", "NoMsgSendType"), msg.attrs.get("GenMsgCycleTime", cycle_default), int(msg.dlc)]
+            row[8] = msg.comment
+            yield row + ["S" if name == msg.sender else "R" if name in msg.receivers else '' for name in nodes]
+            for sig in msg.signals:
+                row = list(blank)
+                mux = sig.mux_indicator or ''
+                start_value = int(sig.attrs.get("GenSigStartValue", 0))
+                if sig.valtype == 1:
+                    data_type = "IEEE Float"
+                elif sig.valtype == 2:
+                    data_type = "IEEE Double"
+                else:
+                    data_type = "Signed" if sig.value_type == '-' else "Unsigned"
+                row[6:20] = [sig.name, int(mux[1:]) if mux[1:].isdigit() else mux, sig.comment,
+                             "Motorola LSB" if str(sig.byte_order) == '1' else "Motorola MSB",   ### as read by import_excel()
+                             int(sig.start_bit), int(sig.sig_len), data_type,
+                             number(sig.factor), number(sig.offset), number(sig.min), number(sig.max),
+                             '0x%X' % start_value if start_value >= 0 else str(start_value), sig.unit,
+                             '\n'.join('%d:%s' % (key, sig.values[key].replace(';', ',').replace(':', ','))
+                                       for key in (sig.values or {}))]
+                yield row + ["R" if name in sig.receivers else '' for name in nodes]
+
+    def to_xlsx(self, path, sheetname="Matrix"):
+        '''
+        Write the network as an excel matrix (see matrix_rows()) which import_excel() and
+        candb gen read back. The workbook is written in openpyxl's write-only mode, row by
+        row, so memory does not grow with the size of the network.
+        '''
+        import openpyxl
+        book = openpyxl.Workbook(write_only=True)
+        sheet = book.create_sheet(sheetname)
+        for row in self.matrix_rows():
+            sheet.append(row)
+        book.save(path)
+
+    def to_decoder_image(self, path):
+        '''
+        Write the decode tables of the network (see freeze()) as a binary image with a fixed
+        layout (IMAGE_HEADER, ...), which DecoderImage maps into memory and decodes from
+        without parsing. Returns the number of messages.
+        '''
+        frozen = self.freeze()
+        strings = bytearray()
+        string_offsets = {}
+        def string(text):
+            if text not in string_offsets:
+                data = text.encode('utf-8')
+                string_offsets[text] = (len(strings), len(data))
+                strings.extend(data)
+            return string_offsets[text]
+        msg_ids, messages, signals, values, ranges = [], [], [], [], []
+        value_tables = {}   ### id(values): (first value, values), shared value tables are written once
+        for msg in sorted(frozen.messages, key=lambda msg: msg.msg_id):
+            sigs = [sig for sig in msg.signals if sig.layout is not None]
+            multiplexor = -1
+            for index, sig in enumerate(sigs):
+                if sig.mux_indicator == 'M':
+                    multiplexor = index
+            if msg.mux_table is not None:
+                multiplexor = -2
+                index = dict((sig.name, num) for num, sig in enumerate(sigs))
+            msg_ids.append(msg.msg_id)
+            messages.append(IMAGE_MESSAGE.pack(len(signals), len(sigs), msg.dlc, multiplexor, *string(msg.name)))
+            for sig in sigs:
+                layout = sig.layout
+                if id(sig.values) not in value_tables:
+                    value_tables[id(sig.values)] = (len(values), len(sig.values))
+                    for value in sorted(sig.values, key=int):
+                        values.append(IMAGE_VALUE.pack(int(value), *string(str(sig.values[value]))))
+                switch, first_range = -1, len(ranges)
+                if msg.mux_table is not None and (sig.mux_switch is not None or sig.mux_value is not None):
+                    switch = index.get(sig.mux_switch, len(sigs))
+                    ranges.extend(IMAGE_RANGE.pack(low, high) for low, high in sig.mux_ranges)
+                flags = (1 if layout.intel else 0) | (2 if layout.signed else 0) | (int(layout.valtype or 0) << 2)
+                signals.append(IMAGE_SIGNAL.pack(flags, layout.length, layout.shift, -1 if sig.mux_value is None else sig.mux_value,
+                                                 switch, len(ranges) - first_range, first_range, layout.factor, layout.offset,
+                                                 *(string(sig.name) + value_tables[id(sig.values)])))
+        offset = IMAGE_HEADER.size
+        offsets = []
+        for size in (4 * len(msg_ids), IMAGE_MESSAGE.size * len(messages), IMAGE_SIGNAL.size * len(signals),
+                     IMAGE_VALUE.size * len(values), IMAGE_RANGE.size * len(ranges)):
+            offsets.append(offset)
+            offset += size
+        offsets.append(offset)
+        with open(path, 'wb') as file:
+            file.write(IMAGE_HEADER.pack(IMAGE_MAGIC, len(messages), len(signals), len(values), len(ranges), *offsets))
+            file.write(struct.pack('<%dI' % len(msg_ids), *msg_ids))
+            file.write(b''.join(messages))
+            file.write(b''.join(signals))
+            file.write(b''.join(values))
+            file.write(b''.join(ranges))
+            file.write(strings)
+        return len(messages)
+
+    def to_sqlite(self, path):
+        '''
+        Write the network into a new SQLite database (an existing file is replaced).
+        Every table is filled with one executemany, all in a single transaction, and
+        indexes are created afterwards on msg_id, names, attribute values and receivers.
+        The view message_receivers lists which node receives which message.
+        '''
+        import sqlite3
+        if path != ':memory:' and os.path.exists(path):
+            os.remove(path)
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.executescript(SQLITE_SCHEMA)
+        signals = []   ### (signal_id, msg_id, CanSignal)
+        for msg in self.messages:
+            for sig in msg.signals:
+                signals.append((len(signals) + 1, msg.msg_id, sig))
+        with conn:
+            conn.executemany("INSERT INTO network_attrs VALUES (?, ?)", self.attrs.items())
+            conn.executemany("INSERT INTO attr_defs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             ((d.name, d.object_type, d.value_type, str(d.min), str(d.max), str(d.default), ','.join(d.values or []))
+                              for d in self.attr_defs))
+            conn.executemany("INSERT INTO nodes VALUES (?, ?)", ((node.name, node.comment) for node in self.nodeobjects))
+            conn.executemany("INSERT INTO node_attrs VALUES (?, ?, ?)",
+                             ((node.name, name, value) for node in self.nodeobjects for name, value in node.attrs.items()))
+            conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+                             ((msg.msg_id, msg.name, msg.dlc, msg.sender, msg.comment) for msg in self.messages))
+            conn.executemany("INSERT INTO message_transmitters VALUES (?, ?)",
+                             ((msg.msg_id, node) for msg in self.messages for node in msg.transmitters))
+            conn.executemany("INSERT INTO message_attrs VALUES (?, ?, ?)",
+                             ((msg.msg_id, name, value) for msg in self.messages for name, value in msg.attrs.items()))
+            conn.executemany("INSERT INTO signals VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             ((sig_id, msg_id, sig.name, sig.mux_indicator, sig.start_bit, sig.sig_len, sig.byte_order,
+                               sig.value_type, sig.valtype, sig.factor, sig.offset, sig.min, sig.max, sig.unit, sig.comment,
+                               sig.attrs.get("SPN")) for sig_id, msg_id, sig in signals))
+            conn.executemany("INSERT INTO signal_receivers VALUES (?, ?)",
+                             ((sig_id, node) for sig_id, msg_id, sig in signals for node in sig.receivers))
+            conn.executemany("INSERT INTO signal_attrs VALUES (?, ?, ?)",
+                             ((sig_id, name, value) for sig_id, msg_id, sig in signals for name, value in sig.attrs.items()))
+            conn.executemany("INSERT INTO signal_values VALUES (?, ?, ?)",
+                             ((sig_id, value, desc) for sig_id, msg_id, sig in signals for value, desc in (sig.values or {}).items()))
+            conn.executemany("INSERT INTO val_tables VALUES (?, ?, ?)",
+                             ((name, value, desc) for valtbl in self.val_tables for name in valtbl for value, desc in valtbl[name].items()))
+            conn.executemany("INSERT INTO envvars VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             ((ev.env_var_name, ev.ev_id, ev.env_var_type, ev.units, ev.minimum, ev.maximum, ev.initial_value, ev.comment)
+                              for ev in self.envvars))
+            conn.executescript(SQLITE_INDEXES)
+        conn.close()
 
     def import_excel(self, path, sheetname=None, template=None):
+        import xlrd
         # Open file
-        book = xlrd.open_workbook(path)
+        if isinstance(path, str) and path != '-' and os.path.splitext(path)[1].lower() not in COMPRESSED_EXTENSIONS:
+            book = xlrd.open_workbook(path)
+        else:
+            with open_dbc(path, 'rb') as file:
+                book = xlrd.open_workbook(file_contents=file.read())
+            path = file_name(path)
+            if os.path.splitext(path)[1].lower() in COMPRESSED_EXTENSIONS:
+                path = os.path.splitext(path)[0]
+            elif path in ('-', '<stdin>'):
+                path = "matrix.xls"
         # open sheet
         if sheetname is not None:
             #print ("use specified sheet: %s"%sheetname)
@@ -1393,14 +2256,14 @@ class CanNetwork(object):
                         signal.value_type = '-'
                         signal.valtype    = 2     # 64-bit IEEE float
                         
-                    signal.factor = row_values[template.sig_factor_col]
-                    signal.offset = row_values[template.sig_offset_col]
-                    signal.min = row_values[template.sig_min_phys_col]
-                    signal.max = row_values[template.sig_max_phys_col]
+                    signal.factor = excel_number(row_values[template.sig_factor_col])
+                    signal.offset = excel_number(row_values[template.sig_offset_col])
+                    signal.min = excel_number(row_values[template.sig_min_phys_col])
+                    signal.max = excel_number(row_values[template.sig_max_phys_col])
                     signal.unit = row_values[template.sig_unit_col]
                     signal.attrs["GenSigStartValue"] = getint((row_values[template.sig_init_val_col]), 0)
                     try:
-                        signal.values = parse_sig_vals(row_values[template.sig_val_col])
+                        signal.values = self.intern_values(parse_sig_vals(row_values[template.sig_val_col]))
                     except ValueError:
                         if debug_enable:
                             print (whoami(), "warning: signal %s\'s value table is ignored" % signal.name)
@@ -1587,7 +2450,7 @@ class CanSignal(object):
         self.valtype = None        ### 0:signed or unsigned integer, 1: 32-bit IEEE-float, 2: 64-bit IEEE-double
         self.byte_order = '0'      ### 1, 0
         self.value_type = '+'      ### '+' unsigned, '-' signed
-        self.factor = 1            ### float, * scale factor
+        self.factor = 1            ### float (DbcNumber when loaded from a dbc), * scale factor
         self.offset = 0            ### float, + offset, float
         self.min = 0               ##3 float
         self.max = 1               ### float
@@ -1649,15 +2512,17 @@ class CanSignal(object):
         self.min                   = cansignal.min               ### 
         self.max                   = cansignal.max               ### 
         self.unit                  = cansignal.unit              ### 
-        if len(self.values) or len(cansignal.values):  ### merge dictionary values
-            self.values.update(cansignal.values)
+        if len(cansignal.values):  ### merge dictionary values, into a copy as value tables may be shared
+            values = dict(self.values)
+            values.update(cansignal.values)
+            self.values = values
         if len(self.receivers) or len(cansignal.receivers):
             pass
             #self.receivers         = list(set(self.receivers.extend(cansignal.receivers)))  ### merging list to have unique values
         if len(self.comment) == 0:
             self.comment           = cansignal.comment.rstrip()                                   ### probably needs more work.            
         if len(self.attrs) or len(cansignal.attrs):  ### merge dictionary values
-            self.values.update(cansignal.values)
+            self.attrs.update(cansignal.attrs)
             
     def set_attr(self, name, value):
         if name == 'values':
@@ -1772,78 +2637,2948 @@ class EnvVariable(object):
         self.comment = comment.strip()
         
     def append_comment(self, comment):
-        self.comment = self.comment + comment            
+        self.comment = self.comment + comment
 
-def parse_args():
-    """
-    Parse command line commands.
-    """
-    import argparse
-    parse = argparse.ArgumentParser()
-    subparser = parse.add_subparsers(title="subcommands")
+class ValidationReport(object):
+    '''
+    Problems found while loading (dangling references, undefined attributes, see
+    CanNetwork.load()) and by CanNetwork.validate() (attribute values out of range,
+    unknown nodes). issues is a list of ValidationIssue(kind, record, detail, source, line);
+    source and line are the file and line number of a loaded record, else '' and None.
+    '''
+    def __init__(self):
+        self.issues = []
 
-    parse_gen = subparser.add_parser("gen", help="Generate dbc from excle file")
-    parse_gen.add_argument("filename", help="The xls file to generate dbc")
-    parse_gen.add_argument("-s","--sheetname",help="set sheet name of xls",default=None)
-    parse_gen.add_argument("-t","--template",help="Choose a template",default=None)
-    parse_gen.add_argument("-d","--debug",help="show debug info",action="store_true", dest="debug_switch", default=False)
-    parse_gen.set_defaults(func=cmd_gen)
+    def add(self, kind, record, detail, source='', line=None):
+        self.issues.append(ValidationIssue(kind, record, detail, source, line))
 
-    parse_sort = subparser.add_parser("sort", help="Sort dbc messages and signals")
-    parse_sort.add_argument("filename", help="Dbc filename")
-    parse_sort.add_argument("-o","--output", help="Specify output file path", default=None)
-    parse_sort.set_defaults(func=cmd_sort)
+    def __len__(self):
+        return len(self.issues)
 
-    parse_sort = subparser.add_parser("merge", help="Merge dbc messages and signals")
-    parse_sort.add_argument("-f","--dbcfiles",   nargs="*", default=[], help="dbc filename list")
-    parse_sort.add_argument("-o","--output", help="Specify output file path", default=None)
-    parse_sort.set_defaults(func=cmd_merge)
+    def __iter__(self):
+        return iter(self.issues)
 
-    parse_cmp = subparser.add_parser("cmp", help="Compare difference bettween two dbc files - not yet implemented.")
-    parse_cmp.add_argument("filename1", help="The base file to be compared with")
-    parse_cmp.add_argument("filename2", help="The new file to be compared")
-    parse_cmp.set_defaults(func=cmd_cmp)
+    def counts(self):
+        '''
+        Return {kind: number of issues}.
+        '''
+        counts = {}
+        for issue in self.issues:
+            counts[issue.kind] = counts.get(issue.kind, 0) + 1
+        return counts
 
-    args = parse.parse_args()
-    args.func(args)
+    def __str__(self):
+        lines = []
+        for issue in self.issues:
+            where = issue.source + (':' + str(issue.line) if issue.line is not None else '') + ': ' if issue.source else ''
+            lines.append(where + issue.kind + ': ' + issue.record + ': ' + issue.detail)
+        return '\n'.join(lines)
 
 
-def cmd_gen(args):
-    global  debug_enable
-    debug_enable = args.debug_switch
-    try:
-        can = CanNetwork()
-        can.import_excel(args.filename, args.sheetname, args.template)
-        can.save()
-    except IOError as e:
-        print (e)
-    except xlrd.biffh.XLRDError as e:
-        print (e)
-        
-        
-def cmd_sort(args):
-    can = CanNetwork()
-    can.load(args.filename)
+class FrozenNetwork(object):
+    '''
+    Read-only snapshot of a CanNetwork, made by CanNetwork.freeze(). It is built from
+    namedtuples (FrozenMessage, FrozenSignal, FrozenNode, FrozenAttrDef), tuples and
+    mapping proxies and never changes, so any number of threads may query and decode
+    without locks. To reload, freeze the new network and replace the reference to the
+    snapshot (a single assignment); readers keep the snapshot they started with.
+
+    messages are sorted like CanNetwork.sort(). by_id maps msg_id to a FrozenMessage,
+    by_name message names, signals_by_name signal names to ((message, signal), ...),
+    attr_defs attribute names to a FrozenAttrDef.
+
+    Networks frozen with the same pool (a dict) share their equal value tables and
+    signal layouts; node names are always interned (see MultiBusDecoder).
+    '''
+    __slots__ = ('name', 'attrs', 'nodes', 'messages', 'attr_defs', 'val_tables', 'by_id', 'by_name', 'signals_by_name')
+
+    def __init__(self, can, pool=None):
+        from types import MappingProxyType
+        proxies = {}    ### id(dict): proxy, so shared value tables stay shared
+        pool = {} if pool is None else pool     ### content: object, shared with the networks frozen with the same pool
+        def proxy(mapping):
+            if id(mapping) not in proxies:
+                if isinstance(mapping, ValueTable):
+                    frozen = pool.setdefault(('VAL_', values_text(mapping)), MappingProxyType(mapping))
+                else:
+                    frozen = MappingProxyType(dict(mapping))
+                proxies[id(mapping)] = (mapping, frozen)
+            return proxies[id(mapping)][1]
+        def names(items):
+            return tuple(sys.intern(name) for name in items)
+
+        mul_vals = {}       ### msg_id: {signal name: SgMulVal}
+        for item in can.sg_mul_vals():
+            mul_vals.setdefault(item.msg_id, {})[item.signal] = item
+        messages = []
+        by_id, by_name, signals_by_name = {}, {}, {}
+        for msg in sorted(can.messages, key=lambda msg: str(msg.msg_id)):
+            signals = []
+            multiplexor = None
+            entries = mul_vals.get(msg.msg_id, {})
+            top = [sig.name for sig in msg.signals if sig.mux_indicator == 'M']
+            extended = bool(entries) or len(top) > 1
+            for sig in sorted(msg.signals, key=lambda sig: sig.start_bit):
+                try:
+                    layout = signal_layout(sig, int(msg.dlc))
+                    layout = pool.setdefault(layout, layout)
+                except ValueError:
+                    layout = None       ### does not fit into the message, not decoded
+                mux = sig.mux_indicator or ''
+                match = re.match(r'm(\d+)(M?)$', mux)
+                mux_value = int(match.group(1)) if match else None
+                entry = entries.get(sig.name)
+                if entry is not None:
+                    switch, ranges = entry.switch, entry.ranges
+                elif mux_value is not None:
+                    switch, ranges = (top[0] if top else None), ((mux_value, mux_value),)
+                else:
+                    switch, ranges = None, ()
+                if match and match.group(2):
+                    extended = True     ### multiplexed multiplexor
+                signals.append(FrozenSignal(sig.name, mux, int(sig.start_bit), int(sig.sig_len), str(sig.byte_order),
+                                            sig.value_type, sig.valtype, getfloat(sig.factor, 1.0), getfloat(sig.offset, 0.0),
+                                            getfloat(sig.min, 0.0), getfloat(sig.max, 0.0), sig.unit, proxy(sig.values or {}),
+                                            names(sig.receivers), sig.comment, proxy(sig.attrs), layout,
+                                            mux_value, switch, ranges))
+                if mux == 'M' and layout is not None:
+                    multiplexor = len(signals) - 1
+            mux_table = None
+            if extended:
+                index = dict((sig.name, num) for num, sig in enumerate(signals))
+                mux_table = compile_mux([sig.layout for sig in signals],
+                                        [None if sig.mux_switch is None and sig.mux_value is None else index.get(sig.mux_switch, len(signals))
+                                         for sig in signals],
+                                        [sig.mux_ranges for sig in signals])
+            message = FrozenMessage(msg.name, msg.msg_id, int(msg.dlc), msg.sender and sys.intern(msg.sender), tuple(signals), proxy(msg.attrs),
+                                    names(msg.receivers), names(msg.transmitters), msg.comment,
+                                    MappingProxyType(dict((sig.name, sig) for sig in signals)), multiplexor, mux_table)
+            messages.append(message)
+            by_id[message.msg_id] = message
+            by_name.setdefault(message.name, message)
+            for sig in signals:
+                signals_by_name.setdefault(sig.name, []).append((message, sig))
+        setattr_ = object.__setattr__
+        setattr_(self, 'name', can.name)
+        setattr_(self, 'attrs', proxy(can.attrs))
+        setattr_(self, 'nodes', tuple(FrozenNode(sys.intern(node.name), node.comment, proxy(node.attrs)) for node in can.nodeobjects))
+        setattr_(self, 'messages', tuple(messages))
+        setattr_(self, 'attr_defs', MappingProxyType(dict(
+            (attr_def.name, FrozenAttrDef(attr_def.name, attr_def.object_type, attr_def.value_type, attr_def.min,
+                                          attr_def.max, attr_def.default, tuple(attr_def.values or ())))
+            for attr_def in can.attr_defs)))
+        setattr_(self, 'val_tables', MappingProxyType(dict((name, proxy(valtbl[name])) for valtbl in can.val_tables for name in valtbl)))
+        setattr_(self, 'by_id', MappingProxyType(by_id))
+        setattr_(self, 'by_name', MappingProxyType(by_name))
+        setattr_(self, 'signals_by_name', MappingProxyType(dict((name, tuple(found)) for name, found in signals_by_name.items())))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(whoami() + " FrozenNetwork can not be changed")
+
+    __delattr__ = __setattr__
+
+    def message(self, key):
+        '''
+        Return the FrozenMessage with the msg_id (int) or name (str) key, None if there is none.
+        '''
+        return self.by_name.get(key) if isinstance(key, str) else self.by_id.get(key)
+
+    def get_msg_attr(self, msg_id, attr_name):
+        '''
+        Return the attribute of a message, else the default of the attribute definition.
+        '''
+        msg = self.by_id.get(msg_id)
+        if msg is not None and attr_name in msg.attrs:
+            return msg.attrs[attr_name]
+        attr_def = self.attr_defs.get(attr_name)
+        return attr_def.default if attr_def is not None else None
+
+    def get_sig_attr(self, msg_id, sig_name, attr_name):
+        '''
+        Return the attribute of a signal, else the default of the attribute definition.
+        '''
+        msg = self.by_id.get(msg_id)
+        sig = msg.signals_by_name.get(sig_name) if msg is not None else None
+        if sig is not None and attr_name in sig.attrs:
+            return sig.attrs[attr_name]
+        attr_def = self.attr_defs.get(attr_name)
+        return attr_def.default if attr_def is not None else None
+
+    def decode(self, msg_id, data, raw=False):
+        '''
+        decode(msg_id, data, raw=False) -> {signal name: physical (or raw) value}
+
+        Decode the frame data of a message; None if the msg_id is unknown. Multiplexed
+        signals are only decoded for the value of their multiplexor.
+        '''
+        msg = self.by_id.get(msg_id)
+        if msg is None:
+            return None
+        return decode_payload(msg, data, raw)
+
+    def encode_columns(self, key, columns, dlc=None):
+        '''
+        encode_columns(key, columns, dlc=None) -> numpy uint8 array (rows, dlc) of payloads
+
+        Encode a table of signal values of the message with the msg_id (int) or name (str)
+        key, see encode_columns().
+        '''
+        msg = self.message(key)
+        if msg is None:
+            raise ValueError(whoami() + " unknown message {!r}".format(key))
+        return encode_columns(msg, columns, dlc)
+
+
+def decode_payload(msg, data, raw=False):
+    '''
+    decode_payload(msg, data, raw=False) -> {signal name: physical (or raw) value}
+
+    Decode frame data with the layouts of a FrozenMessage. Short data is padded with zeros.
+    '''
+    if len(data) < msg.dlc:
+        data = bytes(data) + bytes(msg.dlc - len(data))
+    intel = int.from_bytes(data[:msg.dlc], 'little')
+    motorola = int.from_bytes(data[:msg.dlc], 'big')
+    if msg.mux_table is not None:
+        values = {}
+        for index in mux_active(msg.mux_table, intel, motorola):
+            layout = msg.signals[index].layout
+            value = ((intel if layout.intel else motorola) >> layout.shift) & layout.mask
+            values[layout.name] = value if raw else physical_value(layout, value)
+        return values
+    mux_value = None
+    if msg.multiplexor is not None:
+        layout = msg.signals[msg.multiplexor].layout
+        mux_value = ((intel if layout.intel else motorola) >> layout.shift) & layout.mask
+    values = {}
+    for sig in msg.signals:
+        layout = sig.layout
+        if layout is None or (sig.mux_value is not None and sig.mux_value != mux_value):
+            continue
+        value = ((intel if layout.intel else motorola) >> layout.shift) & layout.mask
+        values[sig.name] = value if raw else physical_value(layout, value)
+    return values
+
+
+def parse_sg_mul_val(line):
+    '''
+    parse_sg_mul_val(line) -> SgMulVal of a SG_MUL_VAL_ record, None if it is not one
+
+    e.g. 'SG_MUL_VAL_ 100 Speed Mode 1-1, 4-6;'
+    '''
+    match = re.match(r'\s*SG_MUL_VAL_\s+(\d+)\s+(\w+)\s+(\w+)\s+(.*?)\s*;', line)
+    if match is None:
+        return None
+    ranges = tuple((int(low), int(high)) for low, high in re.findall(r'(\d+)\s*-\s*(\d+)', match.group(4)))
+    return SgMulVal(int(match.group(1)), match.group(2), match.group(3), ranges)
+
+
+def compile_mux(layouts, switches, ranges):
+    '''
+    compile_mux(layouts, switches, ranges) -> (root, {switch: (layout, starts, groups)})
+
+    Build the lookup table of a message with extended multiplexing. switches[num] is the
+    index of the switch of signal num (None if it is not multiplexed, an index without
+    layout if its switch is unknown) and ranges[num] its ((low, high), ...) raw values.
+    root are the signals decoded always, each switch maps its ascending values to
+    intervals: starts[i] is the lowest value of interval i, groups[i] its (highest value,
+    (signals active in it, ...)). Signals without layout are never decoded.
+    '''
+    root = tuple(num for num, switch in enumerate(switches) if switch is None and layouts[num] is not None)
+    members = {}
+    for num, switch in enumerate(switches):
+        if switch is not None and layouts[num] is not None:
+            members.setdefault(switch, []).append(num)
+    table = {}
+    for switch, nums in members.items():
+        if switch >= len(layouts) or layouts[switch] is None:
+            continue
+        bounds = sorted(set(bound for num in nums for low, high in ranges[num] for bound in (low, high + 1)))
+        starts, groups = [], []
+        for start, stop in zip(bounds, bounds[1:]):
+            active = tuple(num for num in nums if any(low <= start and stop - 1 <= high for low, high in ranges[num]))
+            if active:
+                starts.append(start)
+                groups.append((stop - 1, active))
+        table[switch] = (layouts[switch], tuple(starts), tuple(groups))
+    return root, table
+
+
+def mux_active(mux_table, intel, motorola):
+    '''
+    mux_active(mux_table, intel, motorola) -> [signal index, ...] decoded in a frame
+
+    Follow the switches of a compile_mux() table from the root, looking up the raw value
+    of each active switch in its intervals. intel and motorola are the frame data read as
+    little and big endian integers.
+    '''
+    root, table = mux_table
+    active = list(root)
+    for index in active:    ### grows while the switches are followed
+        entry = table.get(index)
+        if entry is not None:
+            layout, starts, groups = entry
+            value = ((intel if layout.intel else motorola) >> layout.shift) & layout.mask
+            position = bisect.bisect_right(starts, value) - 1
+            if position >= 0 and value <= groups[position][0]:
+                active.extend(groups[position][1])
+    active.sort()
+    return active
+
+
+def physical_value(layout, raw):
+    '''
+    physical_value(layout, raw) -> physical value of a raw integer, the inverse of raw_value()
+    '''
+    if layout.valtype in (1, 2):
+        raw = struct.unpack('<f' if layout.valtype == 1 else '<d', raw.to_bytes(4 if layout.valtype == 1 else 8, 'little'))[0]
+    elif layout.signed and raw >> (layout.length - 1):
+        raw -= 1 << layout.length
+    return raw * layout.factor + layout.offset
+
+
+class MultiBusDecoder(object):
+    '''
+    Decode the frames of several CAN buses, each with its own network. networks maps
+    channel names (as in the logs, e.g. 'can0' or 1, compared as str) to a CanNetwork
+    or FrozenNetwork; the channel '*' decodes the frames of all other channels.
+
+    The messages of all channels are in one dict keyed by (channel, msg_id), so a frame
+    is routed with a single lookup. CanNetworks are frozen with a shared pool, so value
+    tables and signal layouts which are the same on several buses are kept once.
+    '''
+    def __init__(self, networks):
+        pool = {}
+        self.networks = {}
+        self.routes = {}
+        self.pgn_routes = {}    ### (channel, PGN): message, of the J1939PG messages
+        for channel, network in networks.items():
+            channel = str(channel)
+            if not isinstance(network, FrozenNetwork):
+                network = network.freeze(pool)
+            self.networks[channel] = network
+            for msg_id, message in network.by_id.items():
+                self.routes[(channel, msg_id)] = message
+                if msg_id & 0x80000000 and network.get_msg_attr(msg_id, 'VFrameFormat') == 'J1939PG':
+                    self.pgn_routes.setdefault((channel, j1939_pgn(msg_id)), message)
+
+    def message(self, channel, msg_id):
+        '''
+        Return the FrozenMessage of msg_id on the channel, None if there is none. An
+        extended id which is not in the networks is looked up by its J1939 PGN (in the
+        J1939PG messages), so any priority and source address is decoded.
+        '''
+        routes = self.routes
+        channel = str(channel)
+        message = routes.get((channel, msg_id))
+        if message is None:
+            message = routes.get(('*', msg_id))
+            if message is None and msg_id & 0x80000000 and self.pgn_routes:
+                pgn = j1939_pgn(msg_id)
+                message = self.pgn_routes.get((channel, pgn)) or self.pgn_routes.get(('*', pgn))
+        return message
+
+    def decode(self, channel, msg_id, data, raw=False):
+        '''
+        decode(channel, msg_id, data, raw=False) -> (FrozenMessage, {signal name: value})
+
+        Decode a frame of a channel; None if the msg_id is unknown on the channel.
+        '''
+        message = self.message(channel, msg_id)
+        if message is None:
+            return None
+        return message, decode_payload(message, data, raw)
+
+    def decode_frames(self, frames, raw=False):
+        '''
+        decode_frames(frames, raw=False) -> generator of (CanFrame, FrozenMessage, {signal name: value})
+
+        Decode CanFrames (e.g. of read_log()) of all channels. message and values are
+        None for frames which are unknown on their channel.
+        '''
+        routes = self.routes
+        for frame in frames:
+            message = routes.get((frame.channel, frame.msg_id))
+            if message is None:
+                message = self.message(frame.channel, frame.msg_id)
+                if message is None:
+                    yield frame, None, None
+                    continue
+            yield frame, message, decode_payload(message, frame.data, raw)
+
+
+class DecoderImage(object):
+    '''
+    Decoder reading a binary image written by CanNetwork.to_decoder_image(). The file is
+    mapped read-only into memory, so worker processes opening the same image share its
+    pages, and nothing is parsed when it is opened: msg_ids are found by binary search in
+    the image, and the records of a message are unpacked when it is first decoded by
+    the process. Pickling an image (e.g. to a multiprocessing pool) pickles its path.
+    '''
+    def __init__(self, path):
+        import mmap
+        self.path = path
+        with open(path, 'rb') as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.buffer) < IMAGE_HEADER.size or self.buffer[:len(IMAGE_MAGIC)] != IMAGE_MAGIC:
+            self.buffer.close()
+            raise ValueError(whoami() + " {} is not a decoder image of this version, export it again".format(path))
+        header = IMAGE_HEADER.unpack_from(self.buffer, 0)
+        (self.message_count, self.signal_count, self.value_count, self.range_count, ids, self.messages_offset,
+         self.signals_offset, self.values_offset, self.ranges_offset, self.strings_offset) = header[1:]
+        tables = [(ids, self.message_count, 4), (self.messages_offset, self.message_count, IMAGE_MESSAGE.size),
+                  (self.signals_offset, self.signal_count, IMAGE_SIGNAL.size), (self.values_offset, self.value_count, IMAGE_VALUE.size),
+                  (self.ranges_offset, self.range_count, IMAGE_RANGE.size), (self.strings_offset, 0, 0)]
+        if any(offset < IMAGE_HEADER.size or offset + count * size > len(self.buffer) for offset, count, size in tables):
+            self.buffer.close()
+            raise ValueError(whoami() + " {} is truncated or damaged".format(path))
+        if sys.byteorder == 'little':
+            self.msg_ids = memoryview(self.buffer)[ids:ids + 4 * self.message_count].cast('I')
+        else:
+            self.msg_ids = struct.unpack_from('<%dI' % self.message_count, self.buffer, ids)
+        self._messages = {}     ### msg_id: (name, dlc, multiplexor layout, signals, mux table) or None, of the msg_ids met
+
+    def __reduce__(self):
+        return (DecoderImage, (self.path,))
+
+    def __len__(self):
+        return self.message_count
+
+    def __contains__(self, msg_id):
+        return self._message(msg_id) is not None
+
+    def close(self):
+        if isinstance(self.msg_ids, memoryview):
+            self.msg_ids.release()
+        self.buffer.close()
+
+    def _string(self, offset, length):
+        start = self.strings_offset + offset
+        return self.buffer[start:start + length].decode('utf-8')
+
+    def _message(self, msg_id):
+        message = self._messages.get(msg_id, False)
+        if message is not False:
+            return message
+        index = bisect.bisect_left(self.msg_ids, msg_id)
+        message = None
+        if index < self.message_count and self.msg_ids[index] == msg_id:
+            first, count, dlc, multiplexor, name, length = IMAGE_MESSAGE.unpack_from(
+                self.buffer, self.messages_offset + index * IMAGE_MESSAGE.size)
+            signals, switches, ranges = [], [], []
+            for num in range(first, first + count):
+                (flags, sig_len, shift, mux_value, switch, range_count, first_range, factor, offset, sig_name, name_len,
+                 first_value, values) = IMAGE_SIGNAL.unpack_from(self.buffer, self.signals_offset + num * IMAGE_SIGNAL.size)
+                sig_name = self._string(sig_name, name_len)
+                layout = SignalLayout(sig_name, bool(flags & 1), shift, (1 << sig_len) - 1, sig_len, bool(flags & 2),
+                                      flags >> 2, factor, offset)
+                signals.append((sig_name, layout, None if mux_value < 0 else mux_value, first_value, values))
+                switches.append(None if switch < 0 else switch)
+                ranges.append(tuple(IMAGE_RANGE.unpack_from(self.buffer, self.ranges_offset + num_range * IMAGE_RANGE.size)
+                                    for num_range in range(first_range, first_range + range_count)))
+            mux_table = None
+            if multiplexor == -2:
+                mux_table = compile_mux([signal[1] for signal in signals], switches, ranges)
+            message = (self._string(name, length), dlc, signals[multiplexor][1] if multiplexor >= 0 else None, tuple(signals), mux_table)
+        self._messages[msg_id] = message
+        return message
+
+    def message_name(self, msg_id):
+        '''
+        Return the name of the message msg_id, None if it is not in the image.
+        '''
+        message = self._message(msg_id)
+        return None if message is None else message[0]
+
+    def decode(self, msg_id, data, raw=False):
+        '''
+        decode(msg_id, data, raw=False) -> {signal name: physical (or raw) value}
+
+        Decode the frame data of a message like FrozenNetwork.decode(); None if the msg_id
+        is unknown.
+        '''
+        message = self._message(msg_id)
+        if message is None:
+            return None
+        name, dlc, multiplexor, signals, mux_table = message
+        if len(data) < dlc:
+            data = bytes(data) + bytes(dlc - len(data))
+        intel = int.from_bytes(data[:dlc], 'little')
+        motorola = int.from_bytes(data[:dlc], 'big')
+        if mux_table is not None:
+            values = {}
+            for index in mux_active(mux_table, intel, motorola):
+                layout = signals[index][1]
+                value = ((intel if layout.intel else motorola) >> layout.shift) & layout.mask
+                values[layout.name] = value if raw else physical_value(layout, value)
+            return values
+        mux_value = None
+        if multiplexor is not None:
+            mux_value = ((intel if multiplexor.intel else motorola) >> multiplexor.shift) & multiplexor.mask
+        values = {}
+        for sig_name, layout, sig_mux, first_value, count in signals:
+            if sig_mux is not None and sig_mux != mux_value:
+                continue
+            value = ((intel if layout.intel else motorola) >> layout.shift) & layout.mask
+            values[sig_name] = value if raw else physical_value(layout, value)
+        return values
+
+    def value_text(self, msg_id, sig_name, raw):
+        '''
+        Return the text of the raw value of a signal in its value table, None if there is none.
+        '''
+        message = self._message(msg_id)
+        for name, layout, sig_mux, first, count in (message[3] if message is not None else ()):
+            if name == sig_name:
+                low, high = first, first + count
+                while low < high:       ### values are ascending
+                    middle = (low + high) // 2
+                    value, offset, length = IMAGE_VALUE.unpack_from(self.buffer, self.values_offset + middle * IMAGE_VALUE.size)
+                    if value == raw:
+                        return self._string(offset, length)
+                    if value < raw:
+                        low = middle + 1
+                    else:
+                        high = middle
+                return None
+        return None
+
+
+def j1939_pgn(msg_id):
+    '''
+    j1939_pgn(msg_id) -> parameter group number of an extended id, without the destination
+    address of PDU1 (PF < 240) groups
+    '''
+    pgn = (msg_id >> 8) & 0x3FFFF
+    if (pgn >> 8) & 0xFF < 240:
+        pgn &= 0x3FF00
+    return pgn
+
+
+class J1939Reassembler(object):
+    '''
+    Reassemble the J1939 transport protocol (J1939-21) transfers of messages longer than
+    8 bytes, broadcast (TP.CM BAM) and to one destination (TP.CM RTS/CTS), in a stream
+    of CanFrames. frames() passes other frames on and yields a CanFrame of each complete
+    transfer: the time of its last TP.DT, the id of the PGN with the priority of the TP.CM
+    and the source (and destination) address, and the data.
+
+    One transfer is open per channel, source and destination (sessions). Its TP.DT frames
+    must follow within timeout seconds (J1939-21 T1/T3), else it is dropped; at most
+    max_sessions are open and a transfer is at most 1785 bytes. completed, aborted (TP.CM
+    Abort, or a new transfer before the end), timeouts and errors (invalid TP.CM or TP.DT)
+    count the transfers. With keep_tp, TP.CM and TP.DT frames are passed on too.
+    '''
+    def __init__(self, timeout=1.25, max_sessions=1024, keep_tp=False):
+        self.timeout = timeout
+        self.max_sessions = max_sessions
+        self.keep_tp = keep_tp
+        self.sessions = {}  ### (channel, source, destination): [pgn, size, all packets mask, priority, time, buffer, received mask]
+        self.completed = self.aborted = self.timeouts = self.errors = 0
+
+    def expire(self, now):
+        '''
+        Drop the sessions without a frame for timeout seconds before now.
+        '''
+        for key in [key for key, session in self.sessions.items() if now - session[4] > self.timeout]:
+            del self.sessions[key]
+            self.timeouts += 1
+
+    def frames(self, frames):
+        '''
+        frames(frames) -> generator of CanFrame, with the TP frames replaced by the transfers
+        '''
+        sessions = self.sessions
+        for frame in frames:
+            msg_id = frame.msg_id
+            pf = (msg_id >> 16) & 0xFF
+            if not msg_id & 0x80000000 or pf not in (0xEC, 0xEB):
+                yield frame
+                continue
+            if self.keep_tp:
+                yield frame
+            data = frame.data
+            source, destination = msg_id & 0xFF, (msg_id >> 8) & 0xFF
+            key = (frame.channel, source, destination)
+            if len(data) < 8:
+                self.errors += 1
+            elif pf == 0xEB:        ### TP.DT: sequence number, 7 bytes
+                session = sessions.get(key)
+                if session is None:
+                    continue
+                if frame.time - session[4] > self.timeout:
+                    del sessions[key]
+                    self.timeouts += 1
+                    continue
+                sequence = data[0]
+                if (1 << sequence) & ~session[2]:
+                    self.errors += 1
+                    continue
+                session[5][(sequence - 1) * 7:sequence * 7] = data[1:8]
+                session[6] |= 1 << sequence
+                session[4] = frame.time
+                if session[6] == session[2]:
+                    del sessions[key]
+                    self.completed += 1
+                    pgn = session[0]
+                    if (pgn >> 8) & 0xFF < 240:
+                        pgn |= destination
+                    yield CanFrame(frame.time, frame.channel, 0x80000000 | (session[3] << 26) | (pgn << 8) | source,
+                                   bytes(session[5][:session[1]]))
+            elif data[0] in (16, 32):   ### TP.CM RTS or BAM: size, packets, max packets, PGN
+                size, packets = data[1] | data[2] << 8, data[3]
+                if not 8 < size <= 1785 or packets != (size + 6) // 7:
+                    self.errors += 1
+                    continue
+                if key in sessions:
+                    self.aborted += 1
+                elif len(sessions) >= self.max_sessions:
+                    self.expire(frame.time)
+                    if len(sessions) >= self.max_sessions:
+                        del sessions[min(sessions, key=lambda key: sessions[key][4])]
+                        self.timeouts += 1
+                sessions[key] = [data[5] | data[6] << 8 | data[7] << 16, size, ((1 << packets) - 1) << 1,
+                                 (msg_id >> 26) & 0x7, frame.time, bytearray(packets * 7), 0]
+            elif data[0] == 255:        ### TP.CM Abort, by the sender or the receiver
+                pgn = data[5] | data[6] << 8 | data[7] << 16
+                for key in (key, (frame.channel, destination, source)):
+                    if key in sessions and sessions[key][0] == pgn:
+                        del sessions[key]
+                        self.aborted += 1
+
+def crc8_function(poly, init=0xFF, xorout=0xFF):
+    '''
+    crc8_function(poly, init=0xFF, xorout=0xFF) -> checksum function(data, msg_id) of a CRC-8
+
+    Like the other CHECKSUM_ALGORITHMS the function has a batch(rows) attribute, which
+    computes the checksums of the rows of a numpy uint8 array (see IntegrityChecker).
+    '''
+    table = []
+    for byte in range(256):
+        crc = byte
+        for bit in range(8):
+            crc = ((crc << 1) ^ poly) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    table = bytes(table)
+    def crc8(data, msg_id):
+        crc = init
+        for byte in data:
+            crc = table[crc ^ byte]
+        return crc ^ xorout
+    def batch(rows):
+        import numpy as np
+        lookup = np.frombuffer(table, dtype=np.uint8)
+        crc = np.full(len(rows), init, dtype=np.uint8)
+        for column in rows.T:
+            crc = lookup[crc ^ column]
+        return crc ^ np.uint8(xorout)
+    crc8.batch = batch
+    return crc8
+
+def checksum_xor(data, msg_id):
+    value = 0
+    for byte in data:
+        value ^= byte
+    return value
+
+def checksum_sum(data, msg_id):
+    return sum(data) & 0xFF
+
+def _batch_xor(rows):
+    import numpy as np
+    return np.bitwise_xor.reduce(rows, axis=1) if rows.shape[1] else np.zeros(len(rows), dtype=np.uint8)
+
+def _batch_sum(rows):
+    import numpy as np
+    return rows.sum(axis=1, dtype=np.uint64) & np.uint64(0xFF)
+
+checksum_xor.batch = _batch_xor
+checksum_sum.batch = _batch_sum
+
+# checksum functions(data, msg_id) -> int of IntegrityChecker, data is the frame without the checksum
+CHECKSUM_ALGORITHMS = {'crc8': crc8_function(0x1D), 'crc8h2f': crc8_function(0x2F), 'xor': checksum_xor, 'sum': checksum_sum}
+
+def integrity_plan(message, algorithm):
+    '''
+    integrity_plan(message, algorithm) -> (name, dlc, counter, modulus, checksum, clear, keep, algorithm)
+
+    Find the signals of a FrozenMessage with SigType MessageCounter and MessageChecksum and
+    prepare their checks, None if there are none. counter and checksum are layouts (or None),
+    clear masks the checksum bits in the integer of its byte order, keep are the (start, stop)
+    bytes which are not covered completely by the checksum.
+    '''
+    counter = checksum = None
+    modulus = 0
+    for sig in message.signals:
+        if sig.layout is None or sig.mux_value is not None:
+            continue
+        sig_type = str(sig.attrs.get('SigType', '')).upper()
+        if sig_type == 'MESSAGECOUNTER' and counter is None:
+            counter = sig.layout
+            modulus = counter.mask + 1
+            if sig.factor and sig.max > sig.min:
+                modulus = min(modulus, int(round((sig.max - sig.offset) / sig.factor)) + 1)
+        elif sig_type == 'MESSAGECHECKSUM' and checksum is None:
+            checksum = sig.layout
+    if counter is None and checksum is None:
+        return None
+    clear = keep = None
+    if checksum is not None:
+        bits = checksum.mask << checksum.shift
+        clear = ((1 << 8 * message.dlc) - 1) ^ bits
+        covered = [(bits >> (8 * index)) & 0xFF == 0xFF for index in range(message.dlc)]
+        if not checksum.intel:
+            covered.reverse()       ### bits of the big endian integer, byte 0 is the most significant
+        keep = []
+        for index in range(message.dlc):
+            if not covered[index]:
+                if keep and keep[-1][1] == index:
+                    keep[-1] = (keep[-1][0], index + 1)
+                else:
+                    keep.append((index, index + 1))
+        keep = tuple(keep)
+    return (message.name, message.dlc, counter, modulus, checksum, clear, keep, algorithm)
+
+
+def layout_column(payloads, layout):
+    '''
+    layout_column(payloads, layout) -> numpy uint64 raw values of a signal in the rows of
+    a numpy uint8 array (rows, dlc) of frame data
+    '''
+    import numpy as np
+    dlc = payloads.shape[1]
+    low, high = layout.shift // 8, (layout.shift + layout.length - 1) // 8   ### bytes of the integer, least significant first
+    if high - low >= 8:
+        return np.array([(int.from_bytes(bytes(row), 'little' if layout.intel else 'big') >> layout.shift) & layout.mask
+                         for row in payloads], dtype=np.uint64)
+    value = np.zeros(len(payloads), dtype=np.uint64)
+    for byte in range(low, high + 1):
+        column = payloads[:, byte if layout.intel else dlc - 1 - byte].astype(np.uint64)
+        value |= column << np.uint64(8 * (byte - low))
+    return (value >> np.uint64(layout.shift - 8 * low)) & np.uint64(layout.mask)
+
+
+class IntegrityChecker(object):
+    '''
+    Check message counters and checksums of traffic in one pass. The signals are found by
+    their SigType attribute (MessageCounter, MessageChecksum, see integrity_plan()).
+    network is a CanNetwork, FrozenNetwork or MultiBusDecoder; counters are followed per
+    channel and msg_id.
+
+    algorithm is a name of CHECKSUM_ALGORITHMS or a function(data, msg_id) -> checksum,
+    algorithms maps message names or msg_ids to others. data is the frame without the
+    bytes of the checksum signal, with its bits cleared in bytes shared with other signals.
+
+    With numpy (vectorize None: if it is installed, True: required, False: never) the
+    frames are checked in batches per message, see check_batch(); functions without a
+    batch(rows) attribute are then called per frame.
+
+    stats maps (channel, msg_id) to [name, frames, dropped, repeated, corrupted]: dropped
+    counts the counter values skipped, repeated the frames with the counter of the frame
+    before, corrupted the frames with a wrong checksum.
+    '''
+    def __init__(self, network, algorithm='crc8', algorithms=None, vectorize=None):
+        if vectorize is not False:
+            try:
+                import numpy
+                vectorize = True
+            except ImportError:
+                if vectorize:
+                    raise ValueError(whoami() + " numpy is needed to vectorize the checks")
+                vectorize = False
+        self.vectorize = vectorize
+        if not isinstance(network, MultiBusDecoder):
+            network = MultiBusDecoder({'*': network})
+        def function(algorithm):
+            if callable(algorithm):
+                return algorithm
+            if algorithm not in CHECKSUM_ALGORITHMS:
+                raise ValueError(whoami() + " Unknown checksum algorithm '{}', expected one of {}".format(
+                    algorithm, ', '.join(sorted(CHECKSUM_ALGORITHMS))))
+            return CHECKSUM_ALGORITHMS[algorithm]
+        algorithm = function(algorithm)
+        algorithms = dict((key, function(value)) for key, value in (algorithms or {}).items())
+        self.plans = {}
+        for route, message in network.routes.items():
+            plan = integrity_plan(message, algorithms.get(message.name, algorithms.get(message.msg_id, algorithm)))
+            if plan is not None:
+                self.plans[route] = plan
+        self.stats = {}
+        self.counters = {}
+
+    def check(self, channel, msg_id, data):
+        '''
+        Check one frame of a channel.
+        '''
+        self._check_frames((CanFrame(None, channel, msg_id, data),))
+
+    def check_frames(self, frames, batch_size=8192):
+        '''
+        Check CanFrames (e.g. of read_log()), frames of messages without counter and
+        checksum are skipped. Returns the number of frames checked. With numpy the
+        frames are collected per channel and msg_id and checked every batch_size frames.
+        '''
+        if not self.vectorize:
+            return self._check_frames(frames)
+        plans = self.plans
+        batches = {}    ### (channel, msg_id): [data, ...]
+        pending = checked = 0
+        for frame in frames:
+            key = (frame.channel, frame.msg_id)
+            batch = batches.get(key)
+            if batch is None:
+                if key not in plans and ('*', frame.msg_id) not in plans:
+                    continue
+                batch = batches[key] = []
+            batch.append(frame.data)
+            pending += 1
+            if pending >= batch_size:
+                for (channel, msg_id), batch in batches.items():
+                    checked += self.check_batch(channel, msg_id, batch)
+                batches.clear()
+                pending = 0
+        for (channel, msg_id), batch in batches.items():
+            checked += self.check_batch(channel, msg_id, batch)
+        return checked
+
+    def check_batch(self, channel, msg_id, payloads):
+        '''
+        check_batch(channel, msg_id, payloads) -> number of frames checked
+
+        Check consecutive frames of one message with numpy. payloads is a list of frame
+        data or a numpy uint8 array (rows, dlc), e.g. of encode_columns().
+        '''
+        import numpy as np
+        key = (channel, msg_id)
+        plan = self.plans.get(key) or self.plans.get(('*', msg_id))
+        if plan is None or len(payloads) == 0:
+            return 0
+        name, dlc, counter, modulus, checksum, clear, keep, algorithm = plan
+        if not isinstance(payloads, np.ndarray):
+            payloads = np.frombuffer(b''.join(data if len(data) == dlc else bytes(data[:dlc]).ljust(dlc, b'\0')
+                                              for data in payloads), dtype=np.uint8).reshape(-1, dlc)
+        elif payloads.shape[1] != dlc:
+            payloads = np.pad(payloads[:, :dlc], ((0, 0), (0, max(0, dlc - payloads.shape[1]))))
+        counts = self.stats.get(key)
+        if counts is None:
+            counts = self.stats[key] = [name, 0, 0, 0, 0]
+        counts[1] += len(payloads)
+        if counter is not None:
+            values = layout_column(payloads, counter).astype(np.int64)
+            last = self.counters.get(key)
+            steps = np.diff(values if last is None else np.concatenate(([last], values))) % modulus
+            counts[3] += int(np.count_nonzero(steps == 0))
+            counts[2] += int(np.maximum(steps - 1, 0).sum())
+            self.counters[key] = int(values[-1])
+        if checksum is not None:
+            mask = np.frombuffer(clear.to_bytes(dlc, 'little' if checksum.intel else 'big'), dtype=np.uint8)
+            rows = (payloads & mask)[:, [index for start, stop in keep for index in range(start, stop)]]
+            batch = getattr(algorithm, 'batch', None)
+            if batch is not None:
+                sums = batch(rows).astype(np.uint64)
+            else:
+                sums = np.array([algorithm(bytes(row), msg_id) for row in rows], dtype=np.uint64)
+            sums &= np.uint64(checksum.mask)
+            counts[4] += int(np.count_nonzero(sums != layout_column(payloads, checksum)))
+        return len(payloads)
+
+    def _check_frames(self, frames):
+        plans, stats, counters = self.plans, self.stats, self.counters
+        checked = 0
+        for frame in frames:
+            key = (frame.channel, frame.msg_id)
+            plan = plans.get(key) or plans.get(('*', frame.msg_id))
+            if plan is None:
+                continue
+            name, dlc, counter, modulus, checksum, clear, keep, algorithm = plan
+            counts = stats.get(key)
+            if counts is None:
+                counts = stats[key] = [name, 0, 0, 0, 0]
+            counts[1] += 1
+            checked += 1
+            data = frame.data
+            if len(data) < dlc:
+                data = bytes(data) + bytes(dlc - len(data))
+            intel = int.from_bytes(data[:dlc], 'little')
+            motorola = int.from_bytes(data[:dlc], 'big')
+            if counter is not None:
+                value = ((intel if counter.intel else motorola) >> counter.shift) & counter.mask
+                last = counters.get(key)
+                if last is not None:
+                    step = (value - last) % modulus
+                    if step == 0:
+                        counts[3] += 1
+                    elif step != 1:
+                        counts[2] += step - 1
+                counters[key] = value
+            if checksum is not None:
+                if checksum.intel:
+                    value = (intel >> checksum.shift) & checksum.mask
+                    cleared = (intel & clear).to_bytes(dlc, 'little')
+                else:
+                    value = (motorola >> checksum.shift) & checksum.mask
+                    cleared = (motorola & clear).to_bytes(dlc, 'big')
+                if len(keep) != 1:
+                    cleared = b''.join(cleared[start:stop] for start, stop in keep)
+                elif keep[0] != (0, dlc):
+                    cleared = cleared[keep[0][0]:keep[0][1]]
+                if algorithm(cleared, frame.msg_id) & checksum.mask != value:
+                    counts[4] += 1
+        return checked
+
+    def totals(self):
+        '''
+        Return (frames, dropped, repeated, corrupted) of all messages.
+        '''
+        return tuple(sum(counts[index] for counts in self.stats.values()) for index in range(1, 5))
+
+    def __str__(self):
+        lines = ['%-10s %-8s %-32s %10s %8s %8s %9s' % ('msg_id', 'channel', 'message', 'frames', 'dropped', 'repeated', 'corrupted')]
+        for (channel, msg_id), counts in sorted(self.stats.items(), key=lambda item: (str(item[0][0]), item[0][1])):
+            if any(counts[2:]):
+                lines.append('%-10s %-8s %-32s %10d %8d %8d %9d' % ((msg_id, channel) + tuple(counts)))
+        lines.append('%-10s %-8s %-32s %10d %8d %8d %9d' % (('total', '', '%d messages' % len(self.stats)) + self.totals()))
+        return '\n'.join(lines)
+
+
+class RunningStats(object):
+    '''
+    Statistics of a stream of values in constant memory: count, min, max, mean and
+    variance (Welford) and percentiles from a sketch of logarithmic buckets, whose
+    estimates are within the relative error accuracy (default 1%) of the true value.
+    '''
+    __slots__ = ('count', 'min', 'max', 'mean', 'm2', 'buckets', 'zeros', 'gamma', 'log_gamma')
+
+    def __init__(self, accuracy=0.01):
+        self.count = 0
+        self.min = self.max = None
+        self.mean = self.m2 = 0.0
+        self.buckets = {}       ### index: count, value in (gamma ** (index - 1), gamma ** index]
+        self.zeros = 0
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+
+    def add(self, value):
+        self.count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value > 0:
+            index = int(math.ceil(math.log(value) / self.log_gamma))
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+        else:
+            self.zeros += 1
+
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def std(self):
+        return self.variance() ** 0.5
+
+    def percentile(self, percent):
+        '''
+        Return the estimated value below which percent (0..100) of the values are, None without values.
+        '''
+        if not self.count:
+            return None
+        rank = percent / 100.0 * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+
+class TimingMonitor(object):
+    '''
+    Compare the timing of traffic with the network, in one pass and constant memory per
+    message. network is a CanNetwork, FrozenNetwork or MultiBusDecoder; messages are
+    followed per channel and msg_id.
+
+    stats maps (channel, msg_id) to [name, cycle, timeout, RunningStats of the intervals
+    (s), late, early, timeouts]. cycle is the GenMsgCycleTime (s) of cyclic messages (see
+    NON_CYCLIC_SEND_TYPES), else None; an interval longer than cycle * (1 + tolerance) is
+    late, shorter than cycle * (1 - tolerance) early. timeout is the smallest
+    GenSigTimeoutValue (s) of the signals, else None; a longer interval is a timeout.
+    '''
+    def __init__(self, network, tolerance=0.1, accuracy=0.01):
+        if not isinstance(network, MultiBusDecoder):
+            network = MultiBusDecoder({'*': network})
+        self.tolerance = tolerance
+        self.accuracy = accuracy
+        self.plans = {}
+        for (channel, msg_id), message in network.routes.items():
+            frozen = network.networks[channel]
+            cycle = frozen.get_msg_attr(msg_id, 'GenMsgCycleTime')
+            if not cycle or frozen.get_msg_attr(msg_id, 'GenMsgSendType') in NON_CYCLIC_SEND_TYPES:
+                cycle = None
+            else:
+                cycle = float(cycle) / 1000.0
+            timeouts = [float(frozen.get_sig_attr(msg_id, sig.name, 'GenSigTimeoutValue') or 0) for sig in message.signals]
+            timeout = min([value for value in timeouts if value > 0] or [0]) / 1000.0 or None
+            self.plans[(channel, msg_id)] = (message.name, cycle, timeout)
+        self.stats = {}
+        self.last = {}
+
+    def check_frames(self, frames):
+        '''
+        Add the intervals of CanFrames (e.g. of read_log(), in time order per message);
+        frames of unknown messages are skipped. Returns the number of frames checked.
+        '''
+        plans, stats, last = self.plans, self.stats, self.last
+        checked = 0
+        for frame in frames:
+            key = (frame.channel, frame.msg_id)
+            entry = stats.get(key)
+            if entry is None:
+                plan = plans.get(key) or plans.get(('*', frame.msg_id))
+                if plan is None:
+                    continue
+                entry = stats[key] = [plan[0], plan[1], plan[2], RunningStats(self.accuracy), 0, 0, 0]
+            checked += 1
+            time = frame.time
+            previous = last.get(key)
+            last[key] = time
+            if previous is None:
+                continue
+            interval = time - previous
+            entry[3].add(interval)
+            cycle, timeout = entry[1], entry[2]
+            if cycle is not None:
+                if interval > cycle * (1 + self.tolerance):
+                    entry[4] += 1
+                elif interval < cycle * (1 - self.tolerance):
+                    entry[5] += 1
+            if timeout is not None and interval > timeout:
+                entry[6] += 1
+        return checked
+
+    def violations(self):
+        '''
+        Return the number of late, early and timed out intervals of all messages.
+        '''
+        return sum(entry[4] + entry[5] + entry[6] for entry in self.stats.values())
+
+    def __str__(self):
+        def ms(value):
+            return '-' if value is None else '%.3f' % (value * 1000)
+        lines = ['%-10s %-8s %-32s %9s %9s %9s %9s %9s %9s %9s %9s %7s %7s %8s' % (
+                 'msg_id', 'channel', 'message', 'frames', 'cycle', 'timeout', 'min', 'mean', 'std', 'p99', 'max',
+                 'late', 'early', 'timeouts')]
+        for (channel, msg_id), entry in sorted(self.stats.items(), key=lambda item: (str(item[0][0]), item[0][1])):
+            name, cycle, timeout, stats, late, early, timeouts = entry
+            lines.append('%-10s %-8s %-32s %9d %9s %9s %9s %9s %9s %9s %9s %7d %7d %8d%s' % (
+                         msg_id, channel, name, stats.count + 1, ms(cycle), ms(timeout), ms(stats.min),
+                         ms(stats.mean if stats.count else None), ms(stats.std() if stats.count else None),
+                         ms(stats.percentile(99)), ms(stats.max), late, early, timeouts,
+                         ' !' if late or early or timeouts else ''))
+        return '\n'.join(lines)
+
+
+def load_message_records(network, text):
+    """
+    load_message_records(network, text) -> [CanMessage, ...]
+
+    Parse the message records of dbc text into a pickled network (in a worker process of
+    CanNetwork.load_parallel()) and return its messages; messages are not printed.
+    """
+    import contextlib
+    import io
+    import pickle
+    network = pickle.loads(network)
+    with contextlib.redirect_stdout(io.StringIO()):
+        network.load_lines(text.splitlines(True))
+    return network.messages
+
+
+def scan_dbc_records(lines):
+    '''
+    scan_dbc_records(lines) -> generator of (keyword, target, msg_id, [line, ...])
+
+    Split dbc text into records without parsing them: a BO_ line with its SG_ lines,
+    a CM_/VAL_/VAL_TABLE_ spanning several lines, or else a single line. Lines are
+    kept as given (with their line ends). target is 'BO_' or 'SG_' for the CM_ and BA_
+    records of messages and signals, else ''. msg_id is the message a record belongs
+    to (see MESSAGE_RECORDS), None for all other records. keyword is '' for blank lines
+    and single word lines.
+    '''
+    lines = iter(lines)
+    line = next(lines, None)
+    while line is not None:
+        stripped = line.strip()
+        tokens = re.split(r'[\s\(\)\[\]\|\,\:\;]+', stripped)
+        keyword = tokens[0] if len(tokens) >= 2 else ''   ### e.g. the NS_ symbol list, skipped by load() as well
+        record = [line]
+        line = None
+        if keyword == 'BO_':
+            for line in lines:
+                if line.split(None, 1)[:1] != ['SG_']:
+                    break
+                record.append(line)
+                line = None
+        elif keyword == 'CM_' and not re.search(r'\"\s*;$', stripped):
+            for next_line in lines:
+                record.append(next_line)
+                if next_line.rstrip('\r\n').endswith('";'):
+                    break
+        elif keyword in ('VAL_', 'VAL_TABLE_') and not stripped.endswith(';'):
+            for next_line in lines:
+                record.append(next_line)
+                if next_line.rstrip().endswith(';'):
+                    break
+        target = ''
+        msg_id = None
+        position = MESSAGE_RECORDS.get(keyword)
+        if keyword in ('CM_', 'BA_'):
+            target = tokens[position - 1] if len(tokens) > position and tokens[position - 1] in ('BO_', 'SG_') else ''
+            if target == '':
+                position = None
+        if position is not None and len(tokens) > position and tokens[position].isdigit():
+            msg_id = int(tokens[position])
+        yield keyword, target, msg_id, record
+        if line is None:
+            line = next(lines, None)
+
+def sort_dbc_lines(lines):
+    '''
+    sort_dbc_lines(lines) -> [line, ...]
+
+    Sort dbc text like CanNetwork.sort() without parsing it: every run of message
+    records of one section (see MESSAGE_SECTIONS, e.g. the BO_ blocks, the CM_ lines
+    or the BA_ lines of signals) is sorted by str(msg_id), the SG_ lines of a BO_ block
+    and the records of signals within a message by start bit. Sorting is stable, records
+    are never moved across other records and their text is copied unchanged. Blank lines
+    stay where they are, behind the record at the same position of the run.
+    '''
+    lines = list(lines)
+    missing_end = len(lines) > 0 and not lines[-1].endswith('\n')
+    if missing_end:
+        lines[-1] += '\n'
+    blocks = []     ### [section, key, [line, ...], [blank line, ...]]
+    signal_keys = {}    ### (msg_id, signal name): position of the signal in its sorted BO_ block
+    for keyword, target, msg_id, record in scan_dbc_records(lines):
+        section = keyword + target if keyword == 'BA_' else keyword     ### as MESSAGE_SECTIONS
+        if keyword == 'BO_':
+            signals = sorted(record[1:], key=lambda line: int(re.search(r':\s*(\d+)\s*\|', line).group(1)))
+            record = record[:1] + signals
+            for position, line in enumerate(signals):
+                signal_keys.setdefault((msg_id, line.split()[1]), position)
+        if blocks and len(record) == 1 and record[0].strip() == '':
+            blocks[-1][3].extend(record)
+            continue
+        key = None
+        if msg_id is not None:
+            signal = None
+            if target == 'SG_' or keyword in ('VAL_', 'SIG_VALTYPE_'):
+                tokens = re.split(r'[\s\(\)\[\]\|\,\:\;]+', record[0].strip())
+                signal = tokens[MESSAGE_RECORDS[keyword] + 1] if len(tokens) > MESSAGE_RECORDS[keyword] + 1 else ''
+            key = (msg_id, signal)
+        blocks.append([section, key, record, []])
+    def sort_key(block):
+        msg_id, signal = block[1]
+        ### records of the message itself first, then those of its signals as CanNetwork._dbc_chunks() writes them
+        return str(msg_id), -1 if signal is None else signal_keys.get((msg_id, signal), len(signal_keys))
+    output = []
+    start = 0
+    while start < len(blocks):
+        end = start + 1
+        if blocks[start][1] is not None:
+            while end < len(blocks) and blocks[end][0] == blocks[start][0] and blocks[end][1] is not None:
+                end += 1
+            run = sorted(blocks[start:end], key=sort_key)
+        else:
+            run = blocks[start:end]
+        for block, place in zip(run, blocks[start:end]):
+            output.extend(block[2])
+            output.extend(place[3])
+        start = end
+    if missing_end:
+        output[-1] = output[-1][:-1]
+    return output
+
+# kinds of message records, (keyword, target), in the order their lines are loaded per message by merge_sorted_files()
+SORTED_RECORD_KINDS = (('BO_', ''), ('BO_TX_BU_', ''), ('CM_', 'BO_'), ('CM_', 'SG_'), ('BA_', 'BO_'), ('BA_', 'SG_'),
+                       ('VAL_', ''), ('SIG_VALTYPE_', ''), ('SIG_GROUP_', ''))
+
+def _spool_sorted_file(path):
+    '''
+    _spool_sorted_file(path) -> ([line of the records of no message, ...], [spool, ...])
+
+    Read a sorted dbc file once: the message records are copied to a temporary file per
+    kind of record (see SORTED_RECORD_KINDS), checking that each kind is sorted by str(msg_id).
+    '''
+    import tempfile
+    kinds = dict((kind, num) for num, kind in enumerate(SORTED_RECORD_KINDS))
+    spools = [tempfile.TemporaryFile('w+') for kind in SORTED_RECORD_KINDS]
+    lasts = [None] * len(spools)
+    global_lines = []
+    with open_dbc(path) as file:
+        for keyword, target, msg_id, lines in scan_dbc_records(file):
+            if msg_id is None:
+                global_lines.extend(lines)
+                continue
+            num = kinds.get((keyword, target))
+            if num is None:
+                continue
+            key = str(msg_id)
+            if lasts[num] is not None and key < lasts[num]:
+                raise ValueError(whoami() + " \'{}\' is not sorted: {} {} {} after {}".format(file_name(path), keyword, target, msg_id, lasts[num]))
+            lasts[num] = key
+            spools[num].writelines(lines)
+            if not lines[-1].endswith('\n'):
+                spools[num].write('\n')
+    for spool in spools:
+        spool.seek(0)
+    return global_lines, spools
+
+def _sorted_message_groups(spools, file_num):
+    '''
+    Generate (str(msg_id), file_num, [line, ...]) with all the records of one message
+    of a sorted dbc file, in msg_id order, from the spools of _spool_sorted_file(). The
+    spools are read side by side, so only the current message is held in memory.
+    '''
+    def records(spool):
+        for keyword, target, msg_id, lines in scan_dbc_records(spool):
+            yield str(msg_id), lines
+    cursors = [records(spool) for spool in spools]
+    heads = [next(cursor, None) for cursor in cursors]
+    try:
+        while True:
+            keys = [head[0] for head in heads if head is not None]
+            if not keys:
+                break
+            key = min(keys)
+            lines = []
+            for i in range(0, len(cursors)):
+                while heads[i] is not None and heads[i][0] == key:
+                    lines.extend(heads[i][1])
+                    heads[i] = next(cursors[i], None)
+            yield key, file_num, lines
+    finally:
+        for spool in spools:
+            spool.close()
+
+def merge_sorted_files(paths, output):
+    '''
+    merge_sorted_files(paths, output)
+
+    Merge dbc files which are sorted like CanNetwork.sort() (e.g. by candb sort) and
+    write the merged network, sorted the same way, to output, holding one message at a time:
+    -- Every file is read once: the records not belonging to a message (BU_, BA_DEF_,
+    ---  ...) are loaded, in file order, the message records are spooled per kind.
+    -- The messages of all files are then walked together (heap on msg_id), the records
+    ---  of one msg_id are loaded file by file like CanNetwork.load() merges them, and
+    ---  the message is written to one temporary file per dbc section.
+    -- The sections are finally joined into output.
+    Inputs and output may also be '-' or file objects (see open_dbc()).
+    '''
+    import heapq
+    import itertools
+    import shutil
+    import tempfile
+    can = CanNetwork()
+    file_values = []   ### enum values of the attribute definitions as defined by each file
+    file_spools = []
+    for path in paths:
+        print(whoami(), "Reading: ", file_name(path))
+        global_lines, spools = _spool_sorted_file(path)
+        file_spools.append(spools)
+        can.load_lines(global_lines)
+        file_values.append(dict((attr_def.name, attr_def.file_values) for attr_def in can.attr_defs))
+    spools = dict((section, tempfile.TemporaryFile('w+')) for section in MESSAGE_SECTIONS)
+    groups = heapq.merge(*[_sorted_message_groups(inputs, num) for num, inputs in enumerate(file_spools)], key=lambda group: group[0])
+    count = 0
+    for key, file_groups in itertools.groupby(groups, key=lambda group: group[0]):
+        part = CanNetwork(init=False)
+        part.attr_defs = can.attr_defs
+        for key, num, lines in file_groups:
+            for attr_def in can.attr_defs:
+                attr_def.file_values = file_values[num].get(attr_def.name, attr_def.file_values)
+            part.load_lines(lines)
+        part.sort()
+        for section, text in part._dbc_chunks(part.messages, with_globals=False):
+            spools[section].write(text)
+        count += len(part.messages)
+    with open_dbc(output, 'w') as file:
+        for section, text in can._dbc_chunks([]):
+            if section is None:
+                file.write(text)
+            else:
+                spools[section].seek(0)
+                shutil.copyfileobj(spools[section], file)
+                spools[section].close()
+    print(whoami(), "Info: wrote", count, "messages to", file_name(output))
+
+def signal_layout(sig, dlc=8):
+    '''
+    signal_layout(sig, dlc) -> SignalLayout of the signal in a frame of dlc bytes
+
+    The raw value of a signal is (payload >> shift) & mask, where payload is the frame
+    data read as a little endian integer for Intel (@1) signals, else as a big endian one.
+    '''
+    bits = dlc * 8
+    length = int(sig.sig_len)
+    start = int(sig.start_bit)
+    if str(sig.byte_order) == '1':
+        shift = start
+        top = start + length
+    else:
+        ### start bit of a Motorola signal is its MSB, counted 7..0 within each byte
+        msb = (start // 8) * 8 + (7 - start % 8)   ### counted from the first bit of the frame
+        shift = bits - msb - length
+        top = msb + length
+    if shift < 0 or top > bits:
+        raise ValueError(whoami() + " signal \'{}\' does not fit into {} bytes".format(sig.name, dlc))
+    return SignalLayout(sig.name, str(sig.byte_order) == '1', shift, (1 << length) - 1, length,
+                        sig.value_type == '-', sig.valtype, getfloat(sig.factor, 1.0), getfloat(sig.offset, 0.0))
+
+def raw_value(layout, value):
+    '''
+    raw_value(layout, value) -> raw integer of the physical value, limited to the signal's range
+    '''
+    value = (value - layout.offset) / layout.factor
+    if layout.valtype in (1, 2):
+        return int.from_bytes(struct.pack('<f' if layout.valtype == 1 else '<d', value), 'little')
+    raw = int(round(value))
+    if layout.signed:
+        low, high = -(1 << (layout.length - 1)), (1 << (layout.length - 1)) - 1
+    else:
+        low, high = 0, layout.mask
+    return min(max(raw, low), high) & layout.mask
+
+def encode_payload(layouts, raws, dlc=8):
+    '''
+    encode_payload(layouts, raws, dlc) -> bytes of the frame with the raw values of the signals
+    '''
+    intel = motorola = 0
+    for layout, raw in zip(layouts, raws):
+        if layout.intel:
+            intel |= (raw & layout.mask) << layout.shift
+        else:
+            motorola |= (raw & layout.mask) << layout.shift
+    return (int.from_bytes(intel.to_bytes(dlc, 'little'), 'big') | motorola).to_bytes(dlc, 'big')
+
+def encode_columns(msg, columns, dlc=None):
+    '''
+    encode_columns(msg, columns, dlc=None) -> numpy uint8 array (rows, dlc) of payloads
+
+    Encode a table of signal values of a CanMessage or FrozenMessage at once (needs numpy).
+    columns maps signal names to sequences (one value per row) of physical values or
+    labels of the signal's value table; all have the same length. Physical values are
+    limited to [min|max] (unless min == max), then converted with factor and offset (as
+    doubles, so integers are exact up to 53 bits) and limited to the raw range, as
+    raw_value() does. Signals without a column are encoded
+    with their GenSigStartValue. A multiplexed signal is only encoded in the rows where
+    the raw value of its switch selects it (extended multiplexing needs a FrozenMessage),
+    other rows may hold None or nan. Placement uses the signal layouts, so CAN FD lengths work.
+    '''
+    try:
+        import numpy as np
+    except ImportError:
+        raise ValueError(whoami() + " numpy is needed to encode columns, use encode_payload() per frame instead")
+    dlc = int(msg.dlc) if dlc is None else dlc
+    lengths = set(len(column) for column in columns.values())
+    if len(lengths) > 1:
+        raise ValueError(whoami() + " columns of message \'{}\' have different lengths {}".format(msg.name, sorted(lengths)))
+    rows = lengths.pop() if lengths else 1
+    top = [sig.name for sig in msg.signals if sig.mux_indicator == 'M']
+    signals = dict((sig.name, sig) for sig in msg.signals)
+    unknown = set(columns) - set(signals)
+    if unknown:
+        raise ValueError(whoami() + " message \'{}\' has no signal {}".format(msg.name, ', '.join(sorted(unknown))))
+    plans = {}      ### signal name: (layout, switch, ranges)
+    for sig in msg.signals:
+        try:
+            layout = signal_layout(sig, dlc)
+        except ValueError:
+            if sig.name in columns:
+                raise
+            continue                ### does not fit into the message, not encoded
+        if hasattr(sig, 'mux_ranges'):
+            switch, ranges = sig.mux_switch, sig.mux_ranges
+        else:
+            match = re.match(r'm(\d+)M?$', sig.mux_indicator or '')
+            switch, ranges = (top[0] if top else None, ((int(match.group(1)),) * 2,)) if match else (None, ())
+        plans[sig.name] = (layout, switch, ranges)
+
+    raws, active = {}, {}
+    def raws_of(name):
+        ### raw values (uint64) of a signal, 0 in the rows where it is not active
+        if name not in raws:
+            sig = signals[name]
+            layout, switch, ranges = plans[name]
+            if switch is None:
+                rows_active = np.ones(rows, dtype=bool)
+            elif switch not in plans:
+                rows_active = np.zeros(rows, dtype=bool)
+            else:
+                value = raws_of(switch)
+                rows_active = active[switch] & np.logical_or.reduce(
+                    [(value >= low) & (value <= high) for low, high in ranges] + [np.zeros(rows, dtype=bool)])
+            active[name] = rows_active
+            if name in columns:
+                raw = _column_raws(sig, layout, columns[name], rows_active)
+            else:
+                start = sig.attrs.get('GenSigStartValue', 0)
+                if layout.valtype in (1, 2):
+                    start = raw_value(layout, layout.offset + layout.factor * float(start))
+                raw = np.full(rows, int(start) & layout.mask, dtype=np.uint64)
+            raws[name] = np.where(rows_active, raw, np.uint64(0))
+        return raws[name]
+
+    words = (dlc + 7) // 8
+    intel = np.zeros((rows, words), dtype=np.uint64)
+    motorola = np.zeros((rows, words), dtype=np.uint64)
+    pad = words * 64 - dlc * 8      ### bits after the frame in the last word of motorola
+    for name, (layout, switch, ranges) in plans.items():
+        raw = raws_of(name)
+        if layout.intel:
+            target, shift = intel, layout.shift
+        else:
+            target, shift = motorola, layout.shift + pad
+        word, bit = divmod(shift, 64)
+        column = word if layout.intel else words - 1 - word
+        target[:, column] |= raw << np.uint64(bit)
+        if bit + layout.length > 64:
+            target[:, column + (1 if layout.intel else -1)] |= raw >> np.uint64(64 - bit)
+    payloads = intel.astype('<u8').view(np.uint8) | motorola.astype('>u8').view(np.uint8)
+    return payloads[:, :dlc]
+
+def _column_raws(sig, layout, column, rows_active):
+    '''
+    _column_raws(sig, layout, column, rows_active) -> numpy uint64 raw values of a
+    column of physical values and value table labels, see encode_columns()
+    '''
+    import numpy as np
+    values = np.asarray(column)
+    labels = None
+    if values.dtype.kind not in 'biuf':
+        ### labels and numbers (as text), each distinct text is looked up once
+        texts, inverse = np.unique(values.astype(str), return_inverse=True)
+        codes = dict((text, value) for value, text in (sig.values or {}).items())
+        physical = np.empty(len(texts))
+        label_raws = np.zeros(len(texts), dtype=np.int64)
+        is_label = np.zeros(len(texts), dtype=bool)
+        for num, text in enumerate(texts):
+            if text in codes:
+                label_raws[num], is_label[num], physical[num] = codes[text], True, layout.offset
+                continue
+            try:
+                physical[num] = float('nan' if text == 'None' else text)
+            except ValueError:
+                raise ValueError(whoami() + " \'{}\' is no value of signal \'{}\'".format(text, sig.name))
+        inverse = inverse.reshape(-1)
+        labels = (is_label[inverse], label_raws[inverse])
+        values = physical[inverse]
+    values = values.astype(np.float64)
+    missing = np.isnan(values) & rows_active
+    if missing.any():
+        raise ValueError(whoami() + " signal \'{}\' has no value in row {}".format(sig.name, int(np.argmax(missing))))
+    values = np.where(rows_active, values, layout.offset)
+    low, high = getfloat(sig.min, 0.0), getfloat(sig.max, 0.0)
+    if low < high:
+        values = np.clip(values, low, high)
+    values = (values - layout.offset) / layout.factor
+    if layout.valtype in (1, 2):
+        raw = values.astype('<f4').view('<u4') if layout.valtype == 1 else values.view('<u8')
+        raw = raw.astype(np.uint64)
+    else:
+        if layout.signed:
+            low, high = -(1 << (layout.length - 1)), (1 << (layout.length - 1)) - 1
+        else:
+            low, high = 0, layout.mask
+        if labels is not None:
+            values = np.where(labels[0], labels[1], np.rint(values))
+        ### high as the largest float which is not above it, so 64 bit values do not overflow
+        values = np.clip(np.rint(values), low, min(high, np.nextafter(float(high) + 1.0, 0.0)))
+        raw = values.astype(np.int64).view(np.uint64) if layout.signed else values.astype(np.uint64)
+    return raw & np.uint64(layout.mask)
+
+def _generator_start(layout, start):
+    return lambda t: start
+
+def _generator_counter(layout, start):
+    state = [start - 1]
+    def counter(t):
+        state[0] += 1
+        return layout.offset + layout.factor * (state[0] % (layout.mask + 1))
+    return counter
+
+def _generator_random(layout, start):
+    import random
+    low = layout.offset
+    high = layout.offset + layout.factor * (layout.mask >> 1 if layout.signed else layout.mask)
+    return lambda t: random.uniform(low, high)
+
+def _generator_sine(layout, start, period=10.0):
+    low = layout.offset
+    high = layout.offset + layout.factor * (layout.mask >> 1 if layout.signed else layout.mask)
+    return lambda t: low + (high - low) * (0.5 + 0.5 * math.sin(2 * math.pi * t / period))
+
+# signal value generators of candb simulate, name: factory(layout, start value) -> generator(t) -> physical value
+SIGNAL_GENERATORS = {
+    'start':   _generator_start,
+    'counter': _generator_counter,
+    'random':  _generator_random,
+    'sine':    _generator_sine,
+}
+
+# GenMsgSendType values of messages which are not sent periodically
+NON_CYCLIC_SEND_TYPES = ('IfActive', 'spontanWithDelay', 'spontanWithRepetition', 'NotUsed', 'reserved')
+
+class TrafficSimulator(object):
+    '''
+    Generate the frames of the cyclic messages of a network, faster than real time.
+
+    Every message with a GenMsgCycleTime (and a cyclic GenMsgSendType) is sent first after
+    its GenMsgStartDelayTime, then every max(GenMsgCycleTime, GenMsgDelayTime) ms. Due
+    messages are kept in a heap, and when several are due while the bus is busy the lowest
+    identifier wins. A frame occupies the bus for its nominal length (without stuff bits)
+    at the Baudrate of the network.
+
+    Payloads are encoded from GenSigStartValue. generators maps signal names (or '*' for
+    all signals) to a name of SIGNAL_GENERATORS or to a factory(layout, start) returning
+    generator(t) -> physical value. Messages without a generated signal are encoded once.
+    Multiplexed signals are sent for the start value of the multiplexor.
+    bus_load is the share of the bus time the messages need (above 1.0 they fall behind).
+    '''
+    def __init__(self, can, generators=None, baudrate=None):
+        generators = generators or {}
+        if baudrate is None:
+            baudrate = can.attrs.get('Baudrate')
+            if baudrate is None:
+                attr_def = can.get_attr_def('Baudrate')
+                baudrate = attr_def.default if attr_def is not None else 500000
+        self.baudrate = int(baudrate)
+        self.plans = []     ### [msg_id, arbitration key, period, start delay, frame time, payload, layouts, raws, [(index, generator)]]
+        for msg in can.messages:
+            cycle = int(msg.attrs.get('GenMsgCycleTime', 0) or 0)
+            if cycle <= 0 or msg.attrs.get('GenMsgSendType') in NON_CYCLIC_SEND_TYPES:
+                continue
+            period = max(cycle, int(msg.attrs.get('GenMsgDelayTime', 0) or 0)) / 1000.0
+            delay = int(msg.attrs.get('GenMsgStartDelayTime', 0) or 0) / 1000.0
+            dlc = int(msg.dlc)
+            can_id = msg.msg_id & 0x1FFFFFFF
+            if msg.msg_id & 0x80000000:
+                arbitration = ((can_id >> 18) << 19) | (1 << 18) | (can_id & 0x3FFFF)
+                frame_bits = 67 + 8 * dlc
+            else:
+                arbitration = can_id << 19
+                frame_bits = 47 + 8 * dlc
+            mux_value = None
+            for sig in msg.signals:
+                if sig.mux_indicator == 'M':
+                    mux_value = int(sig.attrs.get('GenSigStartValue', 0))
+            layouts, raws, dynamic = [], [], []
+            for sig in msg.signals:
+                if sig.mux_indicator not in ('', 'M') and sig.mux_indicator != 'm' + str(mux_value):
+                    continue
+                layout = signal_layout(sig, dlc)
+                start = sig.attrs.get('GenSigStartValue', 0)
+                if layout.valtype in (1, 2):
+                    raws.append(raw_value(layout, layout.offset + layout.factor * float(start)))
+                else:
+                    raws.append(int(start) & layout.mask)
+                generator = generators.get(sig.name, generators.get('*'))
+                if generator is not None and sig.mux_indicator != 'M':
+                    if not callable(generator):
+                        if generator not in SIGNAL_GENERATORS:
+                            raise ValueError(whoami() + " unknown signal generator \'{}\'".format(generator))
+                        generator = SIGNAL_GENERATORS[generator]
+                    dynamic.append((len(layouts), generator(layout, layout.offset + layout.factor * float(start))))
+                layouts.append(layout)
+            payload = encode_payload(layouts, raws, dlc)
+            self.plans.append([msg.msg_id, arbitration, period, delay, frame_bits / float(self.baudrate),
+                               payload, layouts, raws, dynamic])
+        self.bus_load = sum(plan[4] / plan[2] for plan in self.plans)
+
+    def frames(self, duration):
+        '''
+        Generate (time, msg_id, data) of duration seconds of traffic, time counted
+        in seconds from the start of the simulation.
+        '''
+        import heapq
+        timers = [(plan[3], plan[1], num) for num, plan in enumerate(self.plans) if plan[3] < duration]
+        heapq.heapify(timers)
+        ready = []      ### (arbitration key, num) of the messages waiting for the bus
+        bus_free = 0.0
+        plans = self.plans
+        while timers or ready:
+            now = bus_free if ready else max(bus_free, timers[0][0])
+            while timers and timers[0][0] <= now:
+                due, arbitration, num = timers[0]
+                heapq.heappush(ready, (arbitration, num))
+                due += plans[num][2]
+                if due < duration:
+                    heapq.heapreplace(timers, (due, arbitration, num))
+                else:
+                    heapq.heappop(timers)
+            arbitration, num = heapq.heappop(ready)
+            msg_id, arbitration, period, delay, frame_time, payload, layouts, raws, dynamic = plans[num]
+            if dynamic:
+                for index, generator in dynamic:
+                    raws[index] = raw_value(layouts[index], generator(now))
+                payload = encode_payload(layouts, raws, len(payload))
+            bus_free = now + frame_time
+            yield now, msg_id, payload
+
+def write_candump(frames, file, start=0.0, channel='can0'):
+    '''
+    Write (time, msg_id, data) frames as a candump -L log, e.g. "(1.000000) can0 123#0011".
+    Returns the number of frames.
+    '''
+    ids = {}
+    count = 0
+    for time, msg_id, data in frames:
+        text = ids.get(msg_id)
+        if text is None:
+            text = ids[msg_id] = ' ' + channel + (' %08X#' % (msg_id & 0x1FFFFFFF) if msg_id & 0x80000000 else ' %03X#' % msg_id)
+        file.write('(%.6f)%s%s\n' % (start + time, text, data.hex().upper()))
+        count += 1
+    return count
+
+def write_asc(frames, file, start=0.0, channel=1):
+    '''
+    Write (time, msg_id, data) frames as a Vector ASC log with time stamps relative
+    to start (the measurement start, seconds since the epoch). Returns the number of frames.
+    '''
+    import time as time_module
+    local = time_module.localtime(start)
+    date = time_module.strftime('%a %b %d %I:%M:%S.000 ', local) + time_module.strftime('%p', local).lower() + time_module.strftime(' %Y', local)
+    file.write('date ' + date + '\nbase hex  timestamps absolute\ninternal events logged\n')
+    file.write('Begin Triggerblock ' + date + '\n   0.000000 Start of measurement\n')
+    ids = {}
+    count = 0
+    for time, msg_id, data in frames:
+        text = ids.get(msg_id)
+        if text is None:
+            text = ids[msg_id] = ' %d  %-15s Rx   d %d ' % (channel, '%Xx' % (msg_id & 0x1FFFFFFF) if msg_id & 0x80000000 else '%X' % msg_id, len(data))
+        file.write('%11.6f%s%s\n' % (time, text, data.hex(' ').upper()))
+        count += 1
+    file.write('End TriggerBlock\n')
+    return count
+
+def write_binary(frames, file, start=0.0):
+    '''
+    Write (time, msg_id, data) frames as BINARY_FRAME records: time (seconds since the
+    epoch, double), msg_id (with bit 31 set for extended ids, as in dbc files and
+    SocketCAN), length, data padded to 8 bytes. Returns the number of frames.
+    '''
+    pack = BINARY_FRAME.pack
+    count = 0
+    for time, msg_id, data in frames:
+        file.write(pack(start + time, msg_id, len(data), data))
+        count += 1
+    return count
+
+def binary_records(times, msg_id, payloads, start=0.0):
+    '''
+    binary_records(times, msg_id, payloads, start=0.0) -> numpy array of BINARY_FRAME records
+
+    The frames of one message with the payloads of encode_columns() (at most 8 bytes),
+    e.g. file.write(binary_records(times, msg.msg_id, payloads).tobytes()). For the text
+    formats use write_candump(zip(times, itertools.repeat(msg_id), map(bytes, payloads)), file).
+    '''
+    import numpy as np
+    rows, dlc = payloads.shape
+    if dlc > 8:
+        raise ValueError(whoami() + " binary records hold 8 bytes, not {}".format(dlc))
+    records = np.zeros(rows, dtype=np.dtype([('time', '<f8'), ('msg_id', '<u4'), ('length', 'u1'),
+                                             ('pad', 'V3'), ('data', 'u1', (8,))]))
+    records['time'] = np.asarray(times, dtype=np.float64) + start
+    records['msg_id'] = msg_id
+    records['length'] = dlc
+    records['data'][:, :dlc] = payloads
+    return records
+
+# output formats of candb simulate
+TRAFFIC_WRITERS = {'candump': write_candump, 'asc': write_asc, 'bin': write_binary}
+
+def parse_candump_line(line):
+    '''
+    parse_candump_line(line) -> CanFrame of a candump -L line, e.g. "(1436509052.249713)
+    can0 123#DEADBEEF", None for other lines. CAN FD frames ("##") are read without
+    their flags, remote frames ("#R") have no data. ValueError for invalid numbers.
+    '''
+    fields = line.split()
+    if len(fields) < 3 or not fields[0].startswith('('):
+        return None
+    msg_id, sep, data = fields[2].partition('#')
+    if not sep:
+        return None
+    if data.startswith('#'):
+        data = data[2:]         ### CAN FD: flags nibble before the data
+    elif data.startswith('R'):
+        data = ''
+    return CanFrame(float(fields[0][1:-1]), fields[1], int(msg_id, 16) | 0x80000000 if len(msg_id) > 3 else int(msg_id, 16),
+                    bytes.fromhex(data))
+
+def read_candump(file):
+    '''
+    read_candump(file) -> generator of CanFrame from a candump -L log (text lines), see
+    parse_candump_line().
+    '''
+    for line in file:
+        frame = parse_candump_line(line)
+        if frame is not None:
+            yield frame
+
+def read_asc(file):
+    '''
+    read_asc(file) -> generator of CanFrame from the data frames of a Vector ASC log,
+    times relative to the measurement start, channels as str ('1').
+    '''
+    base = 16
+    for line in file:
+        fields = line.split()
+        if len(fields) < 6 or not fields[1].isdigit() or fields[4].lower() != 'd':
+            if len(fields) > 1 and fields[0] == 'base':
+                base = 16 if fields[1] == 'hex' else 10
+            continue
+        try:
+            time = float(fields[0])
+        except ValueError:
+            continue
+        msg_id = fields[2]
+        if msg_id[-1] in 'xX':
+            msg_id = int(msg_id[:-1], base) | 0x80000000
+        else:
+            msg_id = int(msg_id, base)
+        length = int(fields[5], 16)
+        yield CanFrame(time, fields[1], msg_id, bytes(int(byte, base) for byte in fields[6:6 + length]))
+
+def read_binary(file, channel=None):
+    '''
+    read_binary(file, channel=None) -> generator of CanFrame from BINARY_FRAME records
+    (see write_binary()), which have no channel; channel is used for all frames.
+    '''
+    size = BINARY_FRAME.size
+    rest = b''
+    while True:
+        chunk = file.read(size * 4096)
+        if not chunk:
+            break
+        chunk = rest + chunk
+        end = len(chunk) - len(chunk) % size
+        for time, msg_id, length, data in BINARY_FRAME.iter_unpack(chunk[:end]):
+            yield CanFrame(time, channel, msg_id, data[:length])
+        rest = chunk[end:]
+
+# input formats of candb decode, by extension, else candump
+TRAFFIC_READERS = {'.asc': read_asc, '.bin': read_binary}
+
+def read_log(path, channel=None):
+    '''
+    read_log(path, channel=None) -> generator of CanFrame
+
+    Read a candump, .asc or .bin traffic log (compressed too, see open_dbc()). channel
+    is used for the frames of .bin files, which have none.
+    '''
+    name = file_name(path)
+    if os.path.splitext(name)[1].lower() in COMPRESSED_EXTENSIONS:
+        name = os.path.splitext(name)[0]
+    reader = TRAFFIC_READERS.get(os.path.splitext(name)[1].lower(), read_candump)
+    with open_dbc(path, 'rb' if reader is read_binary else 'r') as file:
+        if reader is read_binary:
+            yield from read_binary(file, channel)
+        else:
+            yield from reader(file)
+
+class FrameParser(object):
+    '''
+    Split a received byte stream into CanFrames, keeping incomplete input for the next
+    feed(). format is 'candump' (candump -L lines, see parse_candump_line()) or 'bin'
+    (BINARY_FRAME records); channel is used for 'bin' frames, which have none.
+    Invalid candump lines are counted in errors.
+    '''
+    def __init__(self, format='candump', channel=None):
+        if format not in ('candump', 'bin'):
+            raise ValueError(whoami() + ": unknown frame format " + repr(format))
+        self.format = format
+        self.channel = channel
+        self.rest = b''
+        self.errors = 0
+
+    def feed(self, data, final=False):
+        '''
+        feed(data, final=False) -> list of CanFrame complete in rest + data; final also
+        parses an unterminated last line (a datagram is a whole unit).
+        '''
+        if self.rest:
+            data = self.rest + data
+        frames = []
+        if self.format == 'bin':
+            size = BINARY_FRAME.size
+            end = len(data) - len(data) % size
+            channel = self.channel
+            for time, msg_id, length, payload in BINARY_FRAME.iter_unpack(data[:end]):
+                frames.append(CanFrame(time, channel, msg_id, payload[:length]))
+        else:
+            end = len(data) if final else data.rfind(b'\n') + 1
+            for line in data[:end].decode('ascii', 'replace').splitlines():
+                try:
+                    frame = parse_candump_line(line)
+                except ValueError:
+                    self.errors += 1
+                    continue
+                if frame is not None:
+                    frames.append(frame)
+        self.rest = b'' if final else data[end:]
+        return frames
+
+class LiveIngest(object):
+    '''
+    asyncio ingestion of live traffic: receive -> decode -> sink, e.g.
+
+        ingest = LiveIngest(MultiBusDecoder(networks), sink)
+        await ingest.start()
+        await ingest.serve_tcp('0.0.0.0', 29536)
+        ...
+        await ingest.stop()
+
+    Each TCP connection or UDP endpoint has a FrameParser; its frames are collected in
+    batches of batch_size (or whatever arrived within max_delay seconds) and put on the
+    bounded decode_queue. A task decodes the batches with the MultiBusDecoder and puts
+    lists of (frame, message, values) of the known frames on the bounded sink_queue,
+    a second task calls sink(batch) (a coroutine function too) for them.
+
+    A full decode_queue pauses reading the TCP connection until its batch is queued, so
+    senders see TCP backpressure; UDP cannot be paused, its batches are dropped. A full
+    sink_queue holds up the decode task, which fills the decode_queue. stats() returns
+    the queue depths and counters.
+    '''
+    def __init__(self, decoder, sink, queue_size=64, batch_size=256, max_delay=0.01, raw=False):
+        import asyncio
+        self.decoder = decoder
+        self.sink = sink
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.raw = raw
+        self.decode_queue = asyncio.Queue(queue_size)
+        self.sink_queue = asyncio.Queue(queue_size)
+        self.counters = dict.fromkeys(('connections', 'received', 'batches', 'decoded', 'unknown', 'sunk',
+                                       'dropped', 'paused', 'errors'), 0)
+        self.servers = []
+        self.protocols = set()
+        self.tasks = []
+
+    async def start(self):
+        '''
+        Start the decode and sink tasks.
+        '''
+        import asyncio
+        self.tasks = [asyncio.ensure_future(self._decode()), asyncio.ensure_future(self._sink())]
+
+    async def serve_tcp(self, host, port, format='candump', channel=None):
+        '''
+        serve_tcp(host, port, format='candump', channel=None) -> asyncio server accepting
+        streams of frames, see FrameParser.
+        '''
+        import asyncio
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(lambda: _IngestProtocol(self, FrameParser(format, channel)), host, port)
+        self.servers.append(server)
+        return server
+
+    async def serve_udp(self, host, port, format='candump', channel=None):
+        '''
+        serve_udp(host, port, format='candump', channel=None) -> datagram transport
+        receiving frames, each datagram holds whole lines or records.
+        '''
+        import asyncio
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: _IngestProtocol(self, FrameParser(format, channel), datagrams=True), local_addr=(host, port))
+        self.servers.append(transport)
+        return transport
+
+    async def stop(self):
+        '''
+        Close the servers and connections, decode and sink what was received and stop
+        the tasks.
+        '''
+        import asyncio
+        for server in self.servers:
+            server.close()
+            if hasattr(server, 'wait_closed'):
+                await server.wait_closed()
+        protocols = list(self.protocols)
+        for protocol in protocols:
+            protocol.transport.close()
+        await asyncio.sleep(0)          ### connection_lost() flushes the connections
+        for protocol in protocols:
+            await protocol.drain()
+        await self.decode_queue.join()
+        await self.sink_queue.join()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.servers = []
+        self.tasks = []
+
+    def stats(self):
+        '''
+        stats() -> dict of the counters (frames received, decoded, unknown, sunk and
+        dropped, batches, paused reads, parse errors, connections) and the current
+        decode_queue and sink_queue depths.
+        '''
+        stats = dict(self.counters)
+        stats['errors'] += sum(protocol.parser.errors for protocol in self.protocols)
+        stats['decode_queue'] = self.decode_queue.qsize()
+        stats['sink_queue'] = self.sink_queue.qsize()
+        return stats
+
+    async def _decode(self):
+        import asyncio
+        counters = self.counters
+        while True:
+            batch = await self.decode_queue.get()
+            try:
+                decoded = [item for item in self.decoder.decode_frames(batch, self.raw) if item[1] is not None]
+                counters['decoded'] += len(decoded)
+                counters['unknown'] += len(batch) - len(decoded)
+                if decoded:
+                    await self.sink_queue.put(decoded)
+            finally:
+                self.decode_queue.task_done()
+            await asyncio.sleep(0)      ### let the receivers run between batches
+
+    async def _sink(self):
+        import inspect
+        while True:
+            batch = await self.sink_queue.get()
+            try:
+                result = self.sink(batch)
+                if inspect.isawaitable(result):
+                    await result
+                self.counters['sunk'] += len(batch)
+            except Exception as e:
+                print(whoami(), "Warning: sink failed:", e, file=sys.stderr)
+            finally:
+                self.sink_queue.task_done()
+
+class _IngestProtocol(object):
+    '''
+    Receiving end of a LiveIngest connection or UDP endpoint, an asyncio stream or
+    datagram protocol (asyncio protocols are duck typed).
+    '''
+    def __init__(self, ingest, parser, datagrams=False):
+        self.ingest = ingest
+        self.parser = parser
+        self.datagrams = datagrams
+        self.transport = None
+        self.loop = None
+        self.pending = []
+        self.timer = None
+        self.backlog = collections.deque()
+        self.pusher = None
+
+    def connection_made(self, transport):
+        import asyncio
+        self.transport = transport
+        self.loop = asyncio.get_running_loop()
+        self.ingest.protocols.add(self)
+        self.ingest.counters['connections'] += 1
+
+    def connection_lost(self, exc):
+        self.add(self.parser.feed(b'', final=True))
+        self.flush()
+        self.ingest.protocols.discard(self)
+        self.ingest.counters['errors'] += self.parser.errors
+        self.parser.errors = 0
+
+    def eof_received(self):
+        return None
+
+    def data_received(self, data):
+        self.add(self.parser.feed(data))
+
+    def datagram_received(self, data, addr):
+        self.add(self.parser.feed(data, final=True))
+
+    def error_received(self, exc):
+        self.ingest.counters['errors'] += 1
+
+    def add(self, frames):
+        if not frames:
+            return
+        self.ingest.counters['received'] += len(frames)
+        self.pending.extend(frames)
+        batch_size = self.ingest.batch_size
+        while len(self.pending) >= batch_size:
+            self.flush(batch_size)
+        if self.pending and self.timer is None:
+            self.timer = self.loop.call_later(self.ingest.max_delay, self.flush)
+
+    def flush(self, count=None):
+        if count is None and self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return
+        batch = self.pending[:count]
+        del self.pending[:count]
+        ingest = self.ingest
+        ingest.counters['batches'] += 1
+        if not self.backlog and not ingest.decode_queue.full():
+            ingest.decode_queue.put_nowait(batch)
+            return
+        if self.datagrams:
+            ingest.counters['dropped'] += len(batch)
+            return
+        ### backpressure: stop reading until the backlog is queued, in order
+        self.backlog.append(batch)
+        if self.pusher is None:
+            self.transport.pause_reading()
+            ingest.counters['paused'] += 1
+            self.pusher = self.loop.create_task(self.push())
+
+    async def push(self):
+        while self.backlog:
+            await self.ingest.decode_queue.put(self.backlog[0])
+            self.backlog.popleft()
+        self.pusher = None
+        if not self.transport.is_closing():
+            self.transport.resume_reading()
+
+    async def drain(self):
+        self.flush()
+        if self.pusher is not None:
+            await self.pusher
+
+def attr_value(attr_def, value):
+    '''
+    attr_value(attr_def, value) -> value typed by a CanAttribution, None if it is not one
+
+    Integer and Hex values are int, Float float, Enumeration the text of the value
+    (an index is looked up), String str.
+    '''
+    value_type = str(attr_def.value_type).upper()
+    try:
+        if value_type in ('INTEGER', 'HEX'):
+            return int(value) if not isinstance(value, str) else int(float(value))
+        if value_type == 'FLOAT':
+            return float(value)
+    except (ValueError, TypeError):
+        return None
+    if value_type == 'ENUMERATION':
+        if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+            values = attr_def.values or []
+            return values[int(value)] if int(value) < len(values) else None
+        return None if value is None else str(value)
+    return None if value is None else str(value)
+
+
+class AttrTable(object):
+    '''
+    Effective attributes of the objects of one type, made by CanNetwork.effective_attrs().
+    keys are the msg_ids of messages, (msg_id, signal name) of signals, names of nodes
+    and '' of the network, objects the CanMessage, (CanMessage, CanSignal), Node or
+    CanNetwork in network order. columns maps attribute names to the list of the values
+    of the objects.
+    '''
+    def __init__(self, object_type, keys, objects, columns):
+        self.object_type = object_type
+        self.keys = keys
+        self.objects = objects
+        self.columns = columns
+        self.rows = dict((key, row) for row, key in enumerate(keys))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def value(self, key, name):
+        '''
+        Return the effective attribute name of the object key, None if there is none.
+        '''
+        row = self.rows.get(key)
+        column = self.columns.get(name)
+        return None if row is None or column is None else column[row]
+
+    def row(self, key):
+        '''
+        Return {attribute name: value} of the object key, None if there is none.
+        '''
+        row = self.rows.get(key)
+        return None if row is None else dict((name, column[row]) for name, column in self.columns.items())
+
+    def where(self, **criteria):
+        '''
+        where(name=value or test, ...) -> [object, ...]
+
+        Objects whose attributes match all criteria, in network order; a criterion is a
+        value, or a function(value) -> bool, e.g. where(GenMsgSendType='Cyclic',
+        GenMsgCycleTime=lambda cycle: cycle < 20).
+        '''
+        rows = range(len(self.keys))
+        for name, test in criteria.items():
+            column = self.columns.get(name)
+            if column is None:
+                return []
+            if callable(test):
+                rows = [row for row in rows if column[row] is not None and test(column[row])]
+            else:
+                rows = [row for row in rows if column[row] == test]
+        return [self.objects[row] for row in rows]
+
+
+class NetworkIndex(object):
+    '''
+    Inverted index of a CanNetwork, see CanNetwork.find_signals()/find_messages().
+    -- Messages and signals are numbered in network order, each key maps to the
+    ---  ascending list of numbers having it, so criteria are combined by intersection.
+    -- Names are also kept sorted for prefix lookups.
+    '''
+    def __init__(self, network):
+        self.messages = list(network.messages)
+        self.signals = []           ### (CanMessage, CanSignal)
+        self.msg_keys = {}          ### (kind, key) -> [message number, ...]
+        self.sig_keys = {}          ### (kind, key) -> [signal number, ...]
+        for msg_num, msg in enumerate(self.messages):
+            self._add(self.msg_keys, msg_num, 'id', msg.msg_id)
+            self._add(self.msg_keys, msg_num, 'name', msg.name)
+            senders = set([msg.sender] + list(msg.transmitters))
+            receivers = set(msg.receivers)
+            for sender in senders:
+                self._add(self.msg_keys, msg_num, 'sender', sender)
+            for name, value in msg.attrs.items():
+                self._add(self.msg_keys, msg_num, 'attr', (name, str(value)))
+            for word in self._words(msg.comment):
+                self._add(self.msg_keys, msg_num, 'word', word)
+            for sig in msg.signals:
+                sig_num = len(self.signals)
+                self.signals.append((msg, sig))
+                self._add(self.sig_keys, sig_num, 'name', sig.name)
+                self._add(self.sig_keys, sig_num, 'unit', sig.unit)
+                for sender in senders:
+                    self._add(self.sig_keys, sig_num, 'sender', sender)
+                for receiver in sig.receivers:
+                    self._add(self.sig_keys, sig_num, 'receiver', receiver)
+                    receivers.add(receiver)
+                for name, value in sig.attrs.items():
+                    self._add(self.sig_keys, sig_num, 'attr', (name, str(value)))
+                for word in self._words(sig.comment):
+                    self._add(self.sig_keys, sig_num, 'word', word)
+            for receiver in receivers:
+                self._add(self.msg_keys, msg_num, 'receiver', receiver)
+        self.msg_names = sorted((key[1], nums) for key, nums in self.msg_keys.items() if key[0] == 'name')
+        self.sig_names = sorted((key[1], nums) for key, nums in self.sig_keys.items() if key[0] == 'name')
+        self.attr_tables = {}       ### object type -> AttrTable, see CanNetwork.effective_attrs()
+
+    def _add(self, keys, num, kind, key):
+        nums = keys.setdefault((kind, key), [])
+        if not nums or nums[-1] != num:
+            nums.append(num)
+
+    def _words(self, text):
+        return set(word for word in re.split(r'\W+', text.lower()) if word) if text else ()
+
+    def _prefixed(self, names, prefix):
+        nums = []
+        for i in range(bisect.bisect_left(names, (prefix,)), len(names)):
+            if not names[i][0].startswith(prefix):
+                break
+            nums.extend(names[i][1])
+        return sorted(nums)
+
+    def _match(self, keys, names, criteria, prefix, attrs):
+        postings = [keys.get(key, []) for key in criteria if key[1] is not None]
+        if prefix is not None:
+            postings.append(self._prefixed(names, prefix))
+        for name, value in (attrs or {}).items():
+            postings.append(keys.get(('attr', (name, str(value))), []))
+        if not postings:
+            return None
+        postings.sort(key=len)
+        result = postings[0]
+        for nums in postings[1:]:
+            if not result:
+                break
+            nums = set(nums)
+            result = [num for num in result if num in nums]
+        return result
+
+    def find_signals(self, name=None, prefix=None, unit=None, receiver=None, sender=None, keyword=None, attrs=None):
+        criteria = [('name', name), ('unit', unit), ('receiver', receiver), ('sender', sender),
+                    ('word', keyword.lower() if keyword is not None else None)]
+        nums = self._match(self.sig_keys, self.sig_names, criteria, prefix, attrs)
+        if nums is None:
+            return list(self.signals)
+        return [self.signals[num] for num in nums]
+
+    def find_messages(self, name=None, prefix=None, msg_id=None, receiver=None, sender=None, keyword=None, attrs=None):
+        criteria = [('name', name), ('id', msg_id), ('receiver', receiver), ('sender', sender),
+                    ('word', keyword.lower() if keyword is not None else None)]
+        nums = self._match(self.msg_keys, self.msg_names, criteria, prefix, attrs)
+        if nums is None:
+            return list(self.messages)
+        return [self.messages[num] for num in nums]
+
+class NetworkCache(object):
+    '''
+    Keeps parsed CanNetwork objects in memory, keyed by the tuple of source files
+    they were loaded from (in order, so a merge of several files is one entry).
+    -- An entry is reloaded when the mtime or size of any of its source files changes.
+    -- The least recently used entries are evicted once max_entries, or max_bytes
+    ---  (sum of the source file sizes), is exceeded.
+    '''
+    def __init__(self, max_entries=16, max_bytes=None):
+        import threading
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()   ### key: (paths, sheetname), value: [stamps, size, network, FrozenNetwork or None]
+        self._lock = threading.RLock()              ### one load at a time, the parser updates module level enum tables
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _stamps(self, paths):
+        stamps = []
+        for path in paths:
+            st = os.stat(path)
+            stamps.append((st.st_mtime, st.st_size))
+        return tuple(stamps)
+
+    def _fresh(self, key, stamps):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == stamps:
+            self._entries.move_to_end(key)
+            return entry[2]
+        return None
+
+    def get(self, paths, sheetname=None):
+        '''
+        get(paths, sheetname=None) -> CanNetwork
+
+        Return the network loaded from paths, parsing only when there is no entry or
+        a source file changed. A single *.xls/*.xlsx path is imported as a matrix.
+        When a leading part of paths is cached (e.g. the base file of several merges),
+        a copy of it is taken and only the remaining files are loaded on top.
+        The returned network is shared: callers must not modify it.
+        '''
+        return self._entry(paths, sheetname)[2]
+
+    def frozen(self, paths, sheetname=None):
+        '''
+        frozen(paths, sheetname=None) -> FrozenNetwork
+
+        Like get(), but return a FrozenNetwork of the network (e.g. to decode frames),
+        made once per loaded network.
+        '''
+        with self._lock:
+            entry = self._entry(paths, sheetname)
+            if entry[3] is None:
+                entry[3] = entry[2].freeze()
+            return entry[3]
+
+    def _entry(self, paths, sheetname):
+        import copy
+        if isinstance(paths, str):
+            paths = [paths]
+        paths = tuple(os.path.abspath(path) for path in paths)
+        with self._lock:
+            stamps = self._stamps(paths)
+            if self._fresh((paths, sheetname), stamps) is not None:
+                self.hits += 1
+                return self._entries[(paths, sheetname)]
+            self.misses += 1
+            if len(paths) == 1 and os.path.splitext(paths[0])[1].lower() in ('.xls', '.xlsx'):
+                can = CanNetwork()
+                can.import_excel(paths[0], sheetname)
+            else:
+                can = None
+                for count in range(len(paths) - 1, 0, -1):
+                    prefix = self._fresh((paths[:count], None), stamps[:count])
+                    if prefix is not None:
+                        can = copy.deepcopy(prefix)
+                        break
+                if can is None:
+                    count = 0
+                    can = CanNetwork()
+                for path in paths[count:]:
+                    can.load(path)
+            entry = [stamps, sum(stamp[1] for stamp in stamps), can, None]
+            self._entries[(paths, sheetname)] = entry
+            self._evict()
+            return entry
+
+    def _evict(self):
+        while len(self._entries) > 1:
+            over_bytes = self.max_bytes is not None and sum(entry[1] for entry in self._entries.values()) > self.max_bytes
+            if len(self._entries) <= self.max_entries and not over_bytes:
+                break
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+def sorted_network(can, option='id'):
+    '''
+    sorted_network(can, option='id') -> CanNetwork
+
+    Return a sorted view of can without modifying it. Messages are shallow copies
+    with their own signal lists, all other objects are shared with can.
+    '''
+    import copy
+    view = copy.copy(can)
+    view.messages = []
+    for msg in can.messages:
+        msg = copy.copy(msg)
+        msg.signals = list(msg.signals)
+        view.messages.append(msg)
+    view.sort(option)
+    return view
+
+def message_summary(msg):
+    '''
+    message_summary(msg) -> dict
+
+    Describe a CanMessage (and its signals) with plain types, e.g. for json output.
+    '''
+    signals = []
+    for sig in msg.signals:
+        signals.append({'name': sig.name, 'mux_indicator': sig.mux_indicator, 'start_bit': sig.start_bit,
+                        'sig_len': sig.sig_len, 'byte_order': sig.byte_order, 'value_type': sig.value_type,
+                        'factor': sig.factor, 'offset': sig.offset, 'min': sig.min, 'max': sig.max,
+                        'unit': sig.unit, 'receivers': list(sig.receivers), 'comment': sig.comment,
+                        'attrs': dict(sig.attrs), 'values': dict(sig.values or {})})
+    return {'msg_id': msg.msg_id, 'name': msg.name, 'dlc': msg.dlc, 'sender': msg.sender,
+            'transmitters': list(msg.transmitters), 'comment': msg.comment, 'attrs': dict(msg.attrs),
+            'signals': signals}
+
+def serve_request(cache, command, request):
+    '''
+    serve_request(cache, command, request) -> dict
+
+    Run one daemon request against networks held by cache.
+    request is a dict as posted to the daemon:
+        sort:    {"file": path, "output": path}
+        merge:   {"files": [path, ...], "output": path}
+        convert: {"file": xls path, "sheetname": name, "output": path}  ("gen" is the same)
+        lookup:  {"files": [path, ...], "msg_id": int, "message": name, "signal": name}
+        decode:  {"files": [path, ...], "msg_id": int, "data": hex string, "raw": false}
+    Without "output", the dbc text is returned as "dbc". decode returns the name of the
+    message as "message" and its signal values as "values" (both null for an unknown msg_id).
+    '''
+    if command in ('sort', 'convert', 'gen'):
+        paths = [request['file']]
+    elif command in ('merge', 'lookup', 'decode'):
+        paths = request.get('files') or [request['file']]
+    else:
+        raise ValueError(whoami() + " Unknown command \'{}\'".format(command))
+    response = {'ok': True}
+    if command == 'decode':
+        frozen = cache.frozen(paths, request.get('sheetname'))
+        msg_id = int(request['msg_id'])
+        msg = frozen.by_id.get(msg_id)
+        response['message'] = None if msg is None else msg.name
+        response['values'] = frozen.decode(msg_id, bytes.fromhex(request['data']), request.get('raw', False))
+        return response
+    can = cache.get(paths, request.get('sheetname'))
+    if command == 'lookup':
+        matches = can.find_messages(name=request.get('message'), msg_id=request.get('msg_id'))
+        if request.get('signal') is not None:
+            with_signal = set(id(msg) for msg, sig in can.find_signals(name=request['signal']))
+            matches = [msg for msg in matches if id(msg) in with_signal]
+        matches = [message_summary(msg) for msg in matches]
+        response['messages'] = matches
+        return response
+    if command == 'sort':
+        can = sorted_network(can)
+    if request.get('output'):
+        can.save(request['output'])
+        response['output'] = request['output']
+    else:
+        response['dbc'] = str(can)
+    return response
+
+def load_manifest(path):
+    '''
+    load_manifest(path) -> (jobs, workers)
+
+    Read a batch manifest: either a list of jobs or {"workers": n, "jobs": [...]}.
+    *.yaml/*.yml manifests need PyYAML, anything else is read as json.
+    '''
+    with open(path, 'r') as file:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError(whoami() + " PyYAML is needed to read '{}', use a json manifest instead".format(path))
+            manifest = yaml.safe_load(file)
+        else:
+            import json
+            manifest = json.load(file)
+    if isinstance(manifest, list):
+        return manifest, None
+    return manifest['jobs'], manifest.get('workers')
+
+def run_batch(jobs, workers=4, cache=None):
+    '''
+    run_batch(jobs, workers=4, cache=None) -> [(job, error), ...]
+
+    Run gen/sort/merge jobs (same fields as the serve requests, "cmd" names the
+    command and "output" is required) on a thread pool in one interpreter.
+    Inputs are parsed once into cache and shared by every job using them.
+    A job reading the output of an earlier job waits for that job to finish and
+    fails if it failed. error is None for jobs that succeeded.
+    '''
+    from concurrent.futures import ThreadPoolExecutor
+    if cache is None:
+        cache = NetworkCache(max_entries=len(jobs) + 1)
+    producers = {}   ### output path -> future of the job writing it
+
+    def run_job(job, waits):
+        for future in waits:
+            error = future.exception()
+            if error is not None:
+                raise ValueError(whoami() + " input job failed: " + repr(error))
+        if not job.get('output'):
+            raise KeyError("job has no 'output'")
+        return serve_request(cache, job['cmd'], job)
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=workers or 1) as executor:
+        for job in jobs:
+            inputs = job.get('files') or [job.get('file')]
+            waits = [producers[os.path.abspath(path)] for path in inputs if path and os.path.abspath(path) in producers]
+            future = executor.submit(run_job, job, waits)
+            if job.get('output'):
+                producers[os.path.abspath(job['output'])] = future
+            futures.append((job, future))
+    return [(job, future.exception()) for job, future in futures]
+
+def make_serve_handler(cache):
+    '''
+    Build the http request handler class of the daemon: the command is the url path,
+    e.g. POST /sort, and the request/response are json objects.
+    '''
+    import json
+    from http.server import BaseHTTPRequestHandler
+
+    class ServeHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length) or b'{}')
+                response = serve_request(cache, self.path.strip('/'), request)
+                status = 200
+            except (KeyError, ValueError, IOError, OSError) as e:
+                response = {'ok': False, 'error': repr(e)}
+                status = 400
+            body = json.dumps(response).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            body = json.dumps({'ok': True, 'entries': len(cache), 'hits': cache.hits, 'misses': cache.misses}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self):
+            return str(self.client_address[0]) if self.client_address else 'unix'
+
+        def log_message(self, format, *args):
+            if debug_enable:
+                BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    return ServeHandler
+
+class _SkippedParser(object):
+    '''
+    Stands in for the parser of a subcommand which is not run, so its arguments are not set up.
+    '''
+    def add_argument(self, *args, **kwargs):
+        pass
+
+    def set_defaults(self, **kwargs):
+        pass
+
+# subcommands of parse_args(), keep in step with the parsers added there
+CLI_COMMANDS = ("gen", "sort", "merge", "cmp", "serve", "batch", "export-sqlite", "split", "simulate", "export-xlsx", "decode", "check", "timing", "live", "export-image")
+
+def parse_args():
+    """
+    Parse command line commands.
+    """
+    import argparse
+    parse = argparse.ArgumentParser()
+    subparser = parse.add_subparsers(title="subcommands")
+    command = None
+    for arg in sys.argv[1:]:
+        if not arg.startswith('-'):
+            command = arg
+            break
+
+    def add_parser(name, **kwargs):
+        # without a known subcommand (e.g. -h) every parser is needed
+        if command in CLI_COMMANDS and command != name:
+            return _SkippedParser()
+        return subparser.add_parser(name, **kwargs)
+
+    parse_gen = add_parser("gen", help="Generate dbc from excle file")
+    parse_gen.add_argument("filename", help="The xls file to generate dbc")
+    parse_gen.add_argument("-s","--sheetname",help="set sheet name of xls",default=None)
+    parse_gen.add_argument("-t","--template",help="Choose a template",default=None)
+    parse_gen.add_argument("-o","--output", help="Specify output file path, - for stdout (default: name of the xls file)", default=None)
+    parse_gen.add_argument("-d","--debug",help="show debug info",action="store_true", dest="debug_switch", default=False)
+    parse_gen.set_defaults(func=cmd_gen)
+
+    parse_sort = add_parser("sort", help="Sort dbc messages and signals")
+    parse_sort.add_argument("filename", help="Dbc filename, - for stdin, may be .gz/.xz/.bz2")
+    parse_sort.add_argument("-o","--output", help="Specify output file path, - for stdout", default=None)
+    parse_sort.add_argument("--fast", action="store_true", default=False, help="reorder the text of the records only, without parsing the file")
+    parse_sort.add_argument("--val-tables", action="store_true", dest="val_tables", default=False, help="write value tables shared by several signals once as VAL_TABLE_ (not with --fast)")
+    parse_sort.add_argument("--strict", action="store_true", default=False, help="report dangling references and invalid attribute values, write nothing if there are any")
+    parse_sort.add_argument("-w","--workers", type=int, default=None, help="parse the messages of the file on this many processes (not with --fast or --strict)")
+    parse_sort.set_defaults(func=cmd_sort)
+
+    parse_sort = add_parser("merge", help="Merge dbc messages and signals")
+    parse_sort.add_argument("-f","--dbcfiles",   nargs="*", default=[], help="dbc filename list")
+    parse_sort.add_argument("-o","--output", help="Specify output file path, - for stdout", default=None)
+    parse_sort.add_argument("--stream", action="store_true", default=False, help="inputs are sorted (candb sort), merge one message at a time")
+    parse_sort.add_argument("--val-tables", action="store_true", dest="val_tables", default=False, help="write value tables shared by several signals once as VAL_TABLE_ (not with --stream)")
+    parse_sort.add_argument("--strict", action="store_true", default=False, help="report dangling references and invalid attribute values, write nothing if there are any")
+    parse_sort.add_argument("-w","--workers", type=int, default=None, help="parse the messages of the first file on this many processes, the others are merged into it serially (not with --stream or --strict)")
+    parse_sort.set_defaults(func=cmd_merge)
+
+    parse_sim = add_parser("simulate", help="Write the traffic of the cyclic messages to a candump/asc/binary log")
+    parse_sim.add_argument("-f","--dbcfiles",   nargs="*", default=[], help="dbc filename list")
+    parse_sim.add_argument("-t","--time", type=float, default=10.0, help="seconds of traffic (default 10)")
+    parse_sim.add_argument("-o","--output", help="Specify output file path, - for stdout", default="traffic.log")
+    parse_sim.add_argument("--format", choices=sorted(TRAFFIC_WRITERS), default=None, help="output format (default from the output extension .asc/.bin, else candump)")
+    parse_sim.add_argument("-g","--generator", nargs="*", default=[], dest="generators", help="SIGNAL=GENERATOR, SIGNAL may be * for all signals, GENERATOR one of " + ', '.join(sorted(SIGNAL_GENERATORS)))
+    parse_sim.add_argument("-b","--baudrate", type=int, default=None, help="bus speed (default the Baudrate of the network)")
+    parse_sim.add_argument("--start", type=float, default=None, help="time stamp of the start in seconds since the epoch (default now)")
+    parse_sim.add_argument("--seed", type=int, default=None, help="seed of the random generator")
+    parse_sim.set_defaults(func=cmd_simulate)
+
+    parse_decode = add_parser("decode", help="Decode a candump/asc/binary log of several buses, with a network per channel")
+    parse_decode.add_argument("logfile", help="The traffic log (.asc, .bin, else candump -L), - for stdin")
+    parse_decode.add_argument("-n","--networks", nargs="+", default=[], help="[CHANNEL=]DBC, without CHANNEL (or *) for all other channels; several dbc of a channel are merged")
+    parse_decode.add_argument("-o","--output", help="Specify output file path, - for stdout", default="-")
+    parse_decode.add_argument("-c","--channel", default=None, help="channel of the frames of a .bin log (default *)")
+    parse_decode.add_argument("--raw", action="store_true", default=False, help="write raw signal values")
+    parse_decode.add_argument("--j1939", action="store_true", default=False, help="reassemble J1939 transport protocol (BAM, RTS/CTS) transfers")
+    parse_decode.set_defaults(func=cmd_decode)
+
+    parse_check = add_parser("check", help="Check message counters and checksums (SigType) of a candump/asc/binary log")
+    parse_check.add_argument("logfile", help="The traffic log (.asc, .bin, else candump -L), - for stdin")
+    parse_check.add_argument("-n","--networks", nargs="+", default=[], help="[CHANNEL=]DBC, without CHANNEL (or *) for all other channels; several dbc of a channel are merged")
+    parse_check.add_argument("-a","--algorithm", choices=sorted(CHECKSUM_ALGORITHMS), default="crc8", help="checksum algorithm (default crc8, SAE J1850)")
+    parse_check.add_argument("--checksum", nargs="*", default=[], dest="checksums", help="MESSAGE=ALGORITHM for messages with another algorithm")
+    parse_check.add_argument("-c","--channel", default=None, help="channel of the frames of a .bin log (default *)")
+    parse_check.set_defaults(func=cmd_check)
+
+    parse_timing = add_parser("timing", help="Compare the message intervals of a candump/asc/binary log with the cycle and timeout times")
+    parse_timing.add_argument("logfile", help="The traffic log (.asc, .bin, else candump -L), - for stdin")
+    parse_timing.add_argument("-n","--networks", nargs="+", default=[], help="[CHANNEL=]DBC, without CHANNEL (or *) for all other channels; several dbc of a channel are merged")
+    parse_timing.add_argument("--tolerance", type=float, default=10.0, help="allowed deviation from the cycle time in percent (default 10)")
+    parse_timing.add_argument("-c","--channel", default=None, help="channel of the frames of a .bin log (default *)")
+    parse_timing.set_defaults(func=cmd_timing)
+
+    parse_live = add_parser("live", help="Decode the frames received on TCP/UDP ports, with a network per channel")
+    parse_live.add_argument("-n","--networks", nargs="+", default=[], help="[CHANNEL=]DBC, without CHANNEL (or *) for all other channels; several dbc of a channel are merged")
+    parse_live.add_argument("--tcp", nargs="*", default=[], help="[HOST:]PORT to accept frame streams on")
+    parse_live.add_argument("--udp", nargs="*", default=[], help="[HOST:]PORT to receive frame datagrams on")
+    parse_live.add_argument("--format", choices=("candump", "bin"), default="candump", help="candump -L lines or binary records (default candump)")
+    parse_live.add_argument("-o","--output", help="Specify output file path, - for stdout", default="-")
+    parse_live.add_argument("-c","--channel", default=None, help="channel of binary frames (default *)")
+    parse_live.add_argument("--queue", type=int, default=64, help="maximum number of batches in each queue (default 64)")
+    parse_live.add_argument("--batch", type=int, default=256, help="frames per decode batch (default 256)")
+    parse_live.add_argument("--stats", type=float, default=None, help="print the queue depths and counters every STATS seconds")
+    parse_live.add_argument("--duration", type=float, default=None, help="stop after DURATION seconds (default: at Ctrl-C)")
+    parse_live.add_argument("--raw", action="store_true", default=False, help="write raw signal values")
+    parse_live.set_defaults(func=cmd_live)
+
+    parse_cmp = add_parser("cmp", help="Compare difference bettween two dbc files - not yet implemented.")
+    parse_cmp.add_argument("filename1", help="The base file to be compared with")
+    parse_cmp.add_argument("filename2", help="The new file to be compared")
+    parse_cmp.set_defaults(func=cmd_cmp)
+
+    parse_serve = add_parser("serve", help="Keep parsed networks in memory and answer sort/merge/convert/lookup requests")
+    parse_serve.add_argument("-p","--port", type=int, default=8765, help="localhost http port (default 8765)")
+    parse_serve.add_argument("-u","--socket", default=None, help="serve on this unix socket path instead of a port")
+    parse_serve.add_argument("-c","--cache-size", type=int, default=16, dest="cache_size", help="maximum number of networks kept in memory")
+    parse_serve.add_argument("-m","--max-mb", type=float, default=None, dest="max_mb", help="maximum size (MB) of the source files kept in memory")
+    parse_serve.add_argument("-d","--debug",help="show debug info",action="store_true", dest="debug_switch", default=False)
+    parse_serve.set_defaults(func=cmd_serve)
+
+    parse_batch = add_parser("batch", help="Run the gen/sort/merge jobs of a json (or yaml) manifest in one process")
+    parse_batch.add_argument("manifest", help="Manifest file with the list of jobs")
+    parse_batch.add_argument("-w","--workers", type=int, default=None, help="number of worker threads (default from manifest, else 4)")
+    parse_batch.add_argument("-d","--debug",help="show debug info",action="store_true", dest="debug_switch", default=False)
+    parse_batch.set_defaults(func=cmd_batch)
+
+    parse_sqlite = add_parser("export-sqlite", help="Write dbc files (merged) into an indexed SQLite database")
+    parse_sqlite.add_argument("-f","--dbcfiles",   nargs="*", default=[], help="dbc filename list")
+    parse_sqlite.add_argument("-o","--output", help="Specify output database path", default="candb.sqlite")
+    parse_sqlite.set_defaults(func=cmd_export_sqlite)
+
+    parse_xlsx = add_parser("export-xlsx", help="Write dbc files (merged) as an excel matrix, as read by gen")
+    parse_xlsx.add_argument("-f","--dbcfiles",   nargs="*", default=[], help="dbc filename list")
+    parse_xlsx.add_argument("-o","--output", help="Specify output file path", default="matrix.xlsx")
+    parse_xlsx.add_argument("-s","--sheetname",help="set sheet name of the matrix",default="Matrix")
+    parse_xlsx.set_defaults(func=cmd_export_xlsx)
+
+    parse_image = add_parser("export-image", help="Write the decode tables of dbc files (merged) as a memory mappable binary image")
+    parse_image.add_argument("-f","--dbcfiles",   nargs="*", default=[], help="dbc filename list")
+    parse_image.add_argument("-o","--output", help="Specify output file path", default="network.cdbi")
+    parse_image.set_defaults(func=cmd_export_image)
+
+    parse_split = add_parser("split", help="Write one dbc per node with the messages it sends or receives")
+    parse_split.add_argument("--per-node", action="store_true", dest="per_node", default=False, help="split by node (required)")
+    parse_split.add_argument("-f","--dbcfiles",   nargs="*", default=[], help="dbc filename list")
+    parse_split.add_argument("-n","--nodes",   nargs="*", default=None, help="only write these nodes")
+    parse_split.add_argument("-o","--output", help="Specify output directory", default=".")
+    parse_split.set_defaults(func=cmd_split)
+
+    args = parse.parse_args()
+    if getattr(args, 'output', None) == '-' and args.func in (cmd_gen, cmd_sort, cmd_merge, cmd_simulate, cmd_decode, cmd_live):
+        args.output = sys.stdout    ### the output goes to stdout, so all messages go to stderr
+        sys.stdout = sys.stderr
+    args.func(args)
+
+
+def cmd_gen(args):
+    global  debug_enable
+    debug_enable = args.debug_switch
+    import xlrd
+    try:
+        can = CanNetwork()
+        can.import_excel(args.filename, args.sheetname, args.template)
+        can.save(args.output)
+    except IOError as e:
+        print (e)
+    except xlrd.biffh.XLRDError as e:
+        print (e)
+        
+        
+def load_strict(can, paths):
+    '''
+    Load the dbc files into can with a ValidationReport and validate the network. Print
+    the problems and exit with status 1 if there are any.
+    '''
+    report = ValidationReport()
+    for path in paths:
+        can.load(path, report)
+    can.validate(report)
+    if len(report):
+        print(report)
+        print(whoami(), "Error:", len(report), "problems found:", report.counts())
+        sys.exit(1)
+
+def cmd_sort(args):
+    if args.strict and args.fast:
+        exit(whoami() + " --strict needs the full load, it can not be used with --fast")
+    if args.workers and (args.fast or args.strict):
+        exit(whoami() + " --workers parallelizes the full load, it can not be used with --fast or --strict")
+    if args.val_tables and args.fast:
+        exit(whoami() + " --val-tables needs the full load, it can not be used with --fast")
+    if args.fast:
+        print(whoami(), "Reading: ", file_name(args.filename))
+        with open_dbc(args.filename, 'r', newline='') as file:
+            lines = sort_dbc_lines(file)
+        with open_dbc("sorted.dbc" if args.output is None else args.output, 'w', newline='') as file:
+            file.writelines(lines)
+        return
+    can = CanNetwork()
+    if args.strict:
+        load_strict(can, [args.filename])
+    else:
+        can.load(args.filename, workers=args.workers)
     can.sort()
     if args.output is None:
-        can.save("sorted.dbc")
+        can.save("sorted.dbc", val_tables=args.val_tables)
     else:
-        can.save(args.output)
+        can.save(args.output, val_tables=args.val_tables)
         
 def cmd_merge(args):
+    if args.strict and args.stream:
+        exit(whoami() + " --strict needs the full load, it can not be used with --stream")
+    if args.workers and (args.stream or args.strict):
+        exit(whoami() + " --workers parallelizes the full load, it can not be used with --stream or --strict")
+    if args.val_tables and args.stream:
+        exit(whoami() + " --val-tables needs the full load, it can not be used with --stream")
+    if args.stream:
+        merge_sorted_files(args.dbcfiles, "sorted.dbc" if args.output is None else args.output)
+        return
     can = CanNetwork()
-    for sourcefile in args.dbcfiles:
-        can.load(sourcefile)
+    if args.strict:
+        load_strict(can, args.dbcfiles)
+    else:
+        for sourcefile in args.dbcfiles:
+            can.load(sourcefile, workers=args.workers)
     if args.output is None:
-        can.save("sorted.dbc")
+        can.save("sorted.dbc", val_tables=args.val_tables)
     else: 
-        can.save(args.output)
+        can.save(args.output, val_tables=args.val_tables)
+
+
+def cmd_export_xlsx(args):
+    can = CanNetwork()
+    for sourcefile in args.dbcfiles:
+        can.load(sourcefile)
+    can.to_xlsx(args.output, args.sheetname)
+    print(whoami(), "Info: wrote", len(can.messages), "messages to", args.output)
+
+
+def cmd_export_image(args):
+    can = CanNetwork()
+    for sourcefile in args.dbcfiles:
+        can.load(sourcefile)
+    count = can.to_decoder_image(args.output)
+    print(whoami(), "Info: wrote", count, "messages to", args.output)
+
+
+def cmd_export_sqlite(args):
+    can = CanNetwork()
+    for sourcefile in args.dbcfiles:
+        can.load(sourcefile)
+    can.to_sqlite(args.output)
+    print(whoami(), "Info: wrote", len(can.messages), "messages to", args.output)
+
+
+def cmd_split(args):
+    if not args.per_node:
+        exit(whoami() + " Only --per-node split is supported")
+    can = CanNetwork()
+    for sourcefile in args.dbcfiles:
+        can.load(sourcefile)
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    networks = can.split_by_node(args.nodes)
+    for name in networks:
+        networks[name].save(os.path.join(args.output, name + ".dbc"))
+    print(whoami(), "Info: wrote", len(networks), "node files to", args.output)
+
+
+def cmd_simulate(args):
+    import time
+    can = CanNetwork()
+    for sourcefile in args.dbcfiles:
+        can.load(sourcefile)
+    generators = {}
+    for item in args.generators:
+        name, sep, generator = item.partition('=')
+        if not sep:
+            exit(whoami() + " Expected SIGNAL=GENERATOR, got '{}'".format(item))
+        generators[name] = generator
+    output_format = args.format
+    if output_format is None:
+        name = file_name(args.output)
+        if os.path.splitext(name)[1].lower() in COMPRESSED_EXTENSIONS:
+            name = os.path.splitext(name)[0]
+        extension = os.path.splitext(name)[1].lower()
+        output_format = 'asc' if extension == '.asc' else 'bin' if extension == '.bin' else 'candump'
+    if args.seed is not None:
+        import random
+        random.seed(args.seed)
+    simulator = TrafficSimulator(can, generators, args.baudrate)
+    if simulator.bus_load > 1.0:
+        print(whoami(), "Warning: bus load is %.0f%%, frames are sent later and later" % (simulator.bus_load * 100))
+    start = time.time() if args.start is None else args.start
+    began = time.time()
+    with open_dbc(args.output, 'wb' if output_format == 'bin' else 'w') as file:
+        count = TRAFFIC_WRITERS[output_format](simulator.frames(args.time), file, start)
+    print(whoami(), "Info: wrote", count, "frames of", len(simulator.plans), "messages in",
+          "%.1f s to" % (time.time() - began), file_name(args.output))
+
+
+def load_channel_networks(items):
+    """
+    load_channel_networks(['[CHANNEL=]DBC', ...]) -> {channel: CanNetwork}, '*' without CHANNEL
+    """
+    networks = {}
+    for item in items:
+        channel, sep, path = item.rpartition('=')
+        networks.setdefault(channel or '*', CanNetwork()).load(path)
+    if not networks:
+        exit(whoami() + " No network given, use -n [CHANNEL=]DBC")
+    return networks
+
+
+def cmd_decode(args):
+    import time
+    networks = load_channel_networks(args.networks)
+    decoder = MultiBusDecoder(networks)
+    began = time.time()
+    count = unknown = 0
+    frames = read_log(args.logfile, args.channel or '*')
+    if args.j1939:
+        reassembler = J1939Reassembler()
+        frames = reassembler.frames(frames)
+    with open_dbc(args.output, 'w') as file:
+        for frame, message, values in decoder.decode_frames(frames, args.raw):
+            count += 1
+            if message is None:
+                unknown += 1
+                continue
+            file.write('(%.6f) %s %s %s\n' % (frame.time, frame.channel, message.name,
+                       ' '.join('%s=%.10g' % item for item in values.items())))
+    print(whoami(), "Info: decoded", count - unknown, "of", count, "frames of", len(networks), "channels in",
+          "%.1f s from" % (time.time() - began), file_name(args.logfile))
+    if args.j1939:
+        print(whoami(), "Info: J1939 transfers:", reassembler.completed, "complete,", reassembler.aborted, "aborted,",
+              reassembler.timeouts + len(reassembler.sessions), "timed out,", reassembler.errors, "invalid frames")
+
+
+def cmd_check(args):
+    import time
+    decoder = MultiBusDecoder(load_channel_networks(args.networks))
+    algorithms = {}
+    for item in args.checksums:
+        name, sep, algorithm = item.partition('=')
+        if not sep:
+            exit(whoami() + " Expected MESSAGE=ALGORITHM, got '{}'".format(item))
+        algorithms[name] = algorithm
+    try:
+        checker = IntegrityChecker(decoder, args.algorithm, algorithms)
+    except ValueError as error:
+        exit(str(error))
+    if not checker.plans:
+        exit(whoami() + " No signal with SigType MessageCounter or MessageChecksum")
+    began = time.time()
+    checked = checker.check_frames(read_log(args.logfile, args.channel or '*'))
+    print(checker)
+    print(whoami(), "Info: checked", checked, "frames of", len(checker.plans), "messages in",
+          "%.1f s from" % (time.time() - began), file_name(args.logfile))
+    if any(checker.totals()[1:]):
+        sys.exit(1)
+
+
+def cmd_timing(args):
+    import time
+    monitor = TimingMonitor(MultiBusDecoder(load_channel_networks(args.networks)), args.tolerance / 100.0)
+    began = time.time()
+    checked = monitor.check_frames(read_log(args.logfile, args.channel or '*'))
+    print(monitor)
+    print(whoami(), "Info: checked", checked, "frames of", len(monitor.stats), "messages in",
+          "%.1f s from" % (time.time() - began), file_name(args.logfile))
+    if monitor.violations():
+        sys.exit(1)
+
+
+def cmd_live(args):
+    import asyncio
+    networks = load_channel_networks(args.networks)
+    if not args.tcp and not args.udp:
+        raise ValueError(whoami() + ": no --tcp or --udp port to receive frames on")
+
+    def address(item):
+        host, sep, port = item.rpartition(':')
+        return host or '0.0.0.0', int(port)
+
+    async def run(file):
+        def sink(batch):
+            file.write(''.join('(%.6f) %s %s %s\n' % (frame.time, frame.channel, message.name,
+                               ' '.join('%s=%.10g' % item for item in values.items()))
+                               for frame, message, values in batch))
+        ingest = LiveIngest(MultiBusDecoder(networks), sink, args.queue, args.batch, raw=args.raw)
+        await ingest.start()
+        channel = args.channel or '*'
+        for item in args.tcp:
+            await ingest.serve_tcp(*address(item), format=args.format, channel=channel)
+        for item in args.udp:
+            await ingest.serve_udp(*address(item), format=args.format, channel=channel)
+        print(whoami(), "Info: receiving", args.format, "frames on", ' '.join(['tcp ' + item for item in args.tcp] +
+                                                                       ['udp ' + item for item in args.udp]))
+        loop = asyncio.get_running_loop()
+        began = loop.time()
+        try:
+            while args.duration is None or loop.time() - began < args.duration:
+                wait = args.stats or 1.0
+                if args.duration is not None:
+                    wait = min(wait, args.duration - (loop.time() - began))
+                await asyncio.sleep(max(wait, 0))
+                if args.stats:
+                    print(whoami(), "Info:", ' '.join('%s=%d' % item for item in ingest.stats().items()))
+        finally:
+            await ingest.stop()
+            file.flush()
+        stats = ingest.stats()
+        print(whoami(), "Info: decoded", stats['decoded'], "of", stats['received'], "frames,", stats['dropped'], "dropped,",
+              stats['errors'], "invalid, from", stats['connections'], "connections in %.1f s" % (loop.time() - began))
+
+    with open_dbc(args.output, 'w') as file:
+        try:
+            asyncio.run(run(file))
+        except KeyboardInterrupt:
+            pass
 
 
 def cmd_cmp(args):
     print ("Compare function is comming soon!")
 
 
+def cmd_batch(args):
+    global  debug_enable
+    debug_enable = args.debug_switch
+    jobs, workers = load_manifest(args.manifest)
+    workers = args.workers or workers or 4
+    results = run_batch(jobs, workers)
+    failed = 0
+    for job, error in results:
+        if error is not None:
+            failed += 1
+            print(whoami(), "Error: job", job.get('cmd'), job.get('files') or job.get('file'), "failed:", repr(error))
+    print(whoami(), "Info:", len(results) - failed, "of", len(results), "jobs done")
+    if failed:
+        sys.exit(1)
+
+
+def cmd_serve(args):
+    global  debug_enable
+    debug_enable = args.debug_switch
+    import socketserver
+    from http.server import HTTPServer
+    max_bytes = None if args.max_mb is None else int(args.max_mb * 1024 * 1024)
+    cache = NetworkCache(args.cache_size, max_bytes)
+    handler = make_serve_handler(cache)
+    if args.socket is not None:
+        if os.path.lexists(args.socket):
+            import socket
+            import stat
+            if not stat.S_ISSOCK(os.lstat(args.socket).st_mode):
+                exit(whoami() + " \'{}\' exists and is not a socket".format(args.socket))
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(args.socket)
+            except OSError:
+                os.remove(args.socket)      ### stale socket of a daemon which is gone
+            else:
+                exit(whoami() + " a daemon is serving on \'{}\' already".format(args.socket))
+            finally:
+                probe.close()
+        server = socketserver.UnixStreamServer(args.socket, handler)
+        print(whoami(), "Serving on unix socket", args.socket)
+    else:
+        server = HTTPServer(('127.0.0.1', args.port), handler)
+        print(whoami(), "Serving on http://127.0.0.1:%d" % args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
 if __name__ == '__main__':
     parse_args()
 